@@ -1,15 +1,31 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.config import settings
+from src.services.answer_cache import answer_cache
+from src.services.degradation import degradation
 from src.utils.logging_config import configure_logging
 from src.routers import health as health_route
 from src.routers import agent as agent_route
+from src.routers import metrics as metrics_route
 
 # Configure logging
 configure_logging()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    degradation.start()
+    await answer_cache.start()
+    yield
+    await answer_cache.stop()
+    await degradation.stop()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Traffic Law QA System",
     description="AI agent to handle traffic law related questions.",
     version=settings.API_VERSION,
@@ -21,10 +37,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 app.include_router(health_route.router)
 app.include_router(agent_route.router)
+app.include_router(metrics_route.router)
 
 
 if __name__ == "__main__":
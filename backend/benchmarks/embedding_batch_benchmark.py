@@ -0,0 +1,104 @@
+"""
+Measure query embedding throughput and latency for batch sizes 1 to 32.
+
+Part 1 embeds the sample queries with the dense and sparse models directly,
+in batches of each size. Part 2 sends the same number of concurrent queries
+through EmbeddingBatcher to show the end-to-end latency callers see.
+The embedding cache is bypassed so every query is actually embedded.
+
+No results are recorded yet: the benchmark needs the dense and sparse
+models (downloaded by fastembed on first use), and without network access
+it stops at that download. EMBEDDING_BATCH_WINDOW_MS and
+EMBEDDING_BATCH_MAX_SIZE keep their defaults until its numbers from the
+deployment hardware are added to the Benchmarks section of the README.
+
+Usage (from the backend directory):
+    python -m benchmarks.embedding_batch_benchmark
+"""
+import asyncio
+import statistics
+import time
+
+from src.config import settings
+from src.services.embedding_scheduler import EmbeddingBatcher
+from src.services.qdrant_service import qdrant_service
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+ROUNDS = 3
+
+BASE_QUERIES = [
+    "nồng độ cồn xe máy phạt bao nhiêu",
+    "vượt đèn đỏ ô tô bị phạt thế nào",
+    "không đội mũ bảo hiểm phạt bao nhiêu tiền",
+    "chạy quá tốc độ 20km/h xe máy",
+    "không có bằng lái xe máy bị phạt gì",
+    "đi ngược chiều trên đường một chiều",
+    "dùng điện thoại khi lái ô tô",
+    "chở ba người trên xe máy",
+]
+
+
+def make_queries(n, round_index):
+    # Distinct strings so nothing is deduplicated inside a batch
+    return [f"{BASE_QUERIES[i % len(BASE_QUERIES)]} ({round_index}-{i})" for i in range(n)]
+
+
+def embed_batch(keys, queries):
+    dense = list(qdrant_service.dense_model.query_embed(queries))
+    sparse = list(qdrant_service.sparse_model.query_embed(queries))
+    return list(zip(dense, sparse))
+
+
+def bench_direct():
+    print("=" * 60)
+    print(f"DIRECT BATCHED EMBEDDING (dense + sparse, EMBEDDING_THREADS={settings.EMBEDDING_THREADS})")
+    print("=" * 60)
+    embed_batch(["warmup"], ["warmup"])
+    for batch_size in BATCH_SIZES:
+        latencies = []
+        for round_index in range(ROUNDS):
+            queries = make_queries(batch_size, round_index)
+            start = time.perf_counter()
+            embed_batch(queries, queries)
+            latencies.append(time.perf_counter() - start)
+        batch_ms = statistics.median(latencies) * 1000
+        throughput = batch_size / statistics.median(latencies)
+        print(f"batch={batch_size:<3} batch latency={batch_ms:8.1f}ms  throughput={throughput:7.1f} queries/s")
+
+
+async def bench_scheduler():
+    print("=" * 60)
+    print(f"EMBEDDING SCHEDULER (window={settings.EMBEDDING_BATCH_WINDOW_MS}ms)")
+    print("=" * 60)
+    for concurrency in BATCH_SIZES:
+        batcher = EmbeddingBatcher(
+            embed_batch,
+            qdrant_service.embed_executor,
+            window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=concurrency,
+        )
+        latencies = []
+        wall_times = []
+        for round_index in range(ROUNDS):
+            queries = make_queries(concurrency, round_index + 100)
+
+            async def timed(query):
+                start = time.perf_counter()
+                await batcher.embed(query, query)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*[timed(query) for query in queries])
+            wall_times.append(time.perf_counter() - start)
+
+        throughput = concurrency / statistics.median(wall_times)
+        p95 = sorted(latencies)[max(0, int(len(latencies) * 0.95) - 1)] * 1000
+        print(
+            f"concurrent={concurrency:<3} median latency={statistics.median(latencies) * 1000:8.1f}ms  "
+            f"p95={p95:8.1f}ms  throughput={throughput:7.1f} queries/s  avg batch={batcher.stats()['avg_batch_size']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    bench_direct()
+    asyncio.run(bench_scheduler())
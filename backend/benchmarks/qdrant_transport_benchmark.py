@@ -0,0 +1,102 @@
+"""
+Compare REST and gRPC for the hybrid search `query_points` call.
+
+Part 1 measures request serialization only: the REST JSON body versus the
+gRPC protobuf message for the same dense + sparse RRF query.
+Part 2 measures round-trip time of the real query against the collection
+through a REST client and a gRPC client, using a precomputed embedding so
+only transport and Qdrant time are counted.
+
+Usage (from the backend directory, with QDRANT_URL/QDRANT_API_KEY configured):
+    python -m benchmarks.qdrant_transport_benchmark
+"""
+import asyncio
+import statistics
+import time
+
+from qdrant_client import AsyncQdrantClient, models
+from qdrant_client.conversions.conversion import RestToGrpc
+
+from src.config import settings
+from src.services.qdrant_service import COLLECTION_NAME, GRPC_CHANNEL_OPTIONS, qdrant_service
+
+QUERY = "nồng độ cồn xe máy phạt bao nhiêu"
+SERIALIZATION_ROUNDS = 1000
+ROUND_TRIPS = 50
+
+
+def bench(label, fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    elapsed_us = (time.perf_counter() - start) / rounds * 1e6
+    size = f"  ({len(result):,} bytes)" if isinstance(result, bytes) else ""
+    print(f"{label:<40} {elapsed_us:8.1f}us{size}")
+
+
+def bench_serialization(dense_vector, sparse_vector, limit):
+    print("=" * 60)
+    print("REQUEST SERIALIZATION")
+    print("=" * 60)
+
+    def build_request():
+        return models.QueryRequest(
+            prefetch=qdrant_service._build_prefetch(dense_vector, sparse_vector, limit),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+        )
+
+    request = build_request()
+    bench("build request (tolist + validation)", build_request, SERIALIZATION_ROUNDS)
+    bench("REST: model -> JSON", lambda: request.model_dump_json(exclude_unset=True).encode(), SERIALIZATION_ROUNDS)
+    bench(
+        "gRPC: model -> protobuf",
+        lambda: RestToGrpc.convert_query_request(request, COLLECTION_NAME).SerializeToString(),
+        SERIALIZATION_ROUNDS,
+    )
+
+
+async def bench_round_trip(label, client, dense_vector, sparse_vector, limit):
+    latencies = []
+    for i in range(ROUND_TRIPS + 5):
+        start = time.perf_counter()
+        await client.query_points(
+            collection_name=COLLECTION_NAME,
+            prefetch=qdrant_service._build_prefetch(dense_vector, sparse_vector, limit),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+        )
+        # The first calls open connections; leave them out
+        if i >= 5:
+            latencies.append((time.perf_counter() - start) * 1000)
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} median={statistics.median(latencies):7.2f}ms  p95={p95:7.2f}ms")
+
+
+async def main():
+    limit = settings.HYBRID_SEARCH_TOP_K
+    dense_vector, sparse_vector = qdrant_service.embed_query(QUERY)
+
+    bench_serialization(dense_vector, sparse_vector, limit)
+
+    print("=" * 60)
+    print(f"ROUND TRIP ({ROUND_TRIPS} queries, limit={limit}, with_payload=True)")
+    print("=" * 60)
+    rest_client = AsyncQdrantClient(url=settings.QDRANT_URL, api_key=settings.QDRANT_API_KEY)
+    grpc_client = AsyncQdrantClient(
+        url=settings.QDRANT_URL,
+        api_key=settings.QDRANT_API_KEY,
+        prefer_grpc=True,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        grpc_options=GRPC_CHANNEL_OPTIONS,
+    )
+    await bench_round_trip("REST", rest_client, dense_vector, sparse_vector, limit)
+    await bench_round_trip("gRPC", grpc_client, dense_vector, sparse_vector, limit)
+    await rest_client.close()
+    await grpc_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
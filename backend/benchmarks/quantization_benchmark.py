@@ -0,0 +1,217 @@
+"""
+Compare dense vector quantization and Matryoshka dimensions against the
+current full-precision 1024-d collection.
+
+Every variant (dimension x quantization) is built as a temporary copy of
+the collection from its stored vectors, then queried with the sample
+queries. For each variant the report shows:
+  - dense recall@k: overlap of the dense top-k with the exact full-precision dense top-k
+  - hybrid recall@k: overlap of the fused dense + sparse top-k with the full-precision fused top-k
+  - median / p95 latency of the hybrid query
+  - estimated RAM of the dense vectors Qdrant keeps in memory (originals
+    move to disk when quantized, only the compressed vectors stay in RAM)
+
+Variants use the quantization config of vectorDB/main.py, so they match
+what ingestion builds.
+
+No results are recorded yet: the benchmark needs the ingested collection
+and the embedding models, and without network access it stops at the model
+download. Until its numbers are added to the Benchmarks section of the
+README, the defaults stay at full precision (DENSE_VECTOR_DIM unset,
+DENSE_QUANTIZATION=none); only adopt a smaller variant once its recall
+here is close to 1.0.
+
+Usage (from the backend directory, with QDRANT_URL/QDRANT_API_KEY configured):
+    python -m benchmarks.quantization_benchmark
+    python -m benchmarks.quantization_benchmark --dims 1024 256 --quantizations none binary
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+from qdrant_client import models
+
+from src.config import ROOT_DIR, settings
+from src.services.qdrant_service import COLLECTION_NAME, qdrant_service
+
+# The ingestion script's collection settings
+sys.path.insert(0, str(ROOT_DIR))
+from vectorDB.main import quantization_config  # noqa: E402
+
+QUERIES = [
+    "nồng độ cồn xe máy phạt bao nhiêu",
+    "vượt đèn đỏ ô tô bị phạt thế nào",
+    "không đội mũ bảo hiểm phạt bao nhiêu tiền",
+    "chạy quá tốc độ 20km/h xe máy",
+    "không có bằng lái xe máy bị phạt gì",
+    "đi ngược chiều trên đường một chiều",
+    "dùng điện thoại khi lái ô tô",
+    "chở ba người trên xe máy",
+    "xe ô tô không có đăng kiểm",
+    "tước giấy phép lái xe bao lâu",
+    "dừng đỗ xe sai quy định trên cao tốc",
+    "không mang theo giấy đăng ký xe",
+]
+ROUNDS = 5
+SCROLL_BATCH_SIZE = 256
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1024, 512, 256])
+    parser.add_argument("--quantizations", nargs="+", default=["none", "scalar", "binary"])
+    parser.add_argument("--oversampling", type=float, default=settings.DENSE_QUANTIZATION_OVERSAMPLING)
+    parser.add_argument("--k", type=int, nargs="+", default=[settings.RERANK_TOP_K * 2, settings.HYBRID_SEARCH_TOP_K])
+    return parser.parse_args()
+
+
+def truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    truncated = vectors[..., :dim]
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (truncated / norms).astype(np.float32)
+
+
+def ram_bytes(count: int, dim: int, quantization: str) -> int:
+    if quantization == "scalar":
+        return count * dim
+    if quantization == "binary":
+        return count * dim // 8
+    return count * dim * 4
+
+
+def load_points():
+    """All point ids with their dense and sparse vectors from the source collection."""
+    ids, dense, sparse = [], [], []
+    offset = None
+    while True:
+        points, offset = qdrant_service.client.scroll(
+            COLLECTION_NAME, limit=SCROLL_BATCH_SIZE, offset=offset, with_vectors=True, with_payload=False
+        )
+        for point in points:
+            ids.append(point.id)
+            dense.append(point.vector["dense"])
+            sparse.append(point.vector["sparse"])
+        if offset is None:
+            break
+    return ids, np.array(dense, dtype=np.float32), sparse
+
+
+def build_variant(name, ids, dense, sparse, dim, quantization):
+    client = qdrant_service.client
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(
+        collection_name=name,
+        vectors_config={
+            "dense": models.VectorParams(
+                distance=models.Distance.COSINE,
+                size=dim,
+                on_disk=quantization != "none",
+                quantization_config=quantization_config(quantization),
+            ),
+        },
+        sparse_vectors_config={"sparse": models.SparseVectorParams(modifier=models.Modifier.IDF)},
+    )
+    vectors = truncate(dense, dim)
+    for start in range(0, len(ids), SCROLL_BATCH_SIZE):
+        end = start + SCROLL_BATCH_SIZE
+        client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(id=point_id, vector={"dense": vector.tolist(), "sparse": sparse_vector})
+                for point_id, vector, sparse_vector in zip(ids[start:end], vectors[start:end], sparse[start:end])
+            ],
+            wait=True,
+        )
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+
+def dense_search(collection, dense_vector, limit, params):
+    response = qdrant_service.client.query_points(
+        collection_name=collection, query=dense_vector.tolist(), using="dense", limit=limit, search_params=params
+    )
+    return [point.id for point in response.points]
+
+
+def hybrid_search(collection, dense_vector, sparse_vector, limit, params):
+    response = qdrant_service.client.query_points(
+        collection_name=collection,
+        prefetch=[
+            models.Prefetch(query=dense_vector.tolist(), using="dense", params=params, limit=limit),
+            models.Prefetch(
+                query=models.SparseVector(indices=sparse_vector.indices.tolist(), values=sparse_vector.values.tolist()),
+                using="sparse",
+                limit=limit,
+            ),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=limit,
+    )
+    return [point.id for point in response.points]
+
+
+def recall(found, expected, k):
+    return len(set(found[:k]) & set(expected[:k])) / max(1, min(k, len(expected)))
+
+
+def main():
+    args = parse_args()
+    depth = max(args.k)
+
+    print(f"Loading vectors from {COLLECTION_NAME}...")
+    ids, dense, sparse = load_points()
+    dims = [dim for dim in args.dims if dim <= dense.shape[1]]
+    # Full-dimension query vectors: variants truncate them like QdrantService would
+    query_dense = np.array([next(iter(qdrant_service.dense_model.query_embed(q))) for q in QUERIES], dtype=np.float32)
+    query_sparse = [next(iter(qdrant_service.sparse_model.query_embed(q))) for q in QUERIES]
+
+    exact = models.SearchParams(exact=True)
+    truth_dense = [dense_search(COLLECTION_NAME, q, depth, exact) for q in query_dense]
+    truth_hybrid = [hybrid_search(COLLECTION_NAME, d, s, depth, exact) for d, s in zip(query_dense, query_sparse)]
+
+    header = f"{'variant':<16}" + "".join(f"{f'dense@{k}':>10}{f'hybrid@{k}':>11}" for k in args.k)
+    header += f"{'median ms':>11}{'p95 ms':>9}{'dense RAM':>12}"
+    print("=" * len(header))
+    print(f"{len(ids)} points, {len(QUERIES)} queries, oversampling={args.oversampling}, rescore=True")
+    print("=" * len(header))
+    print(header)
+
+    for dim in dims:
+        for quantization in args.quantizations:
+            name = f"{COLLECTION_NAME}_bench_{dim}_{quantization}"
+            build_variant(name, ids, dense, sparse, dim, quantization)
+            params = None
+            if quantization != "none":
+                params = models.SearchParams(
+                    quantization=models.QuantizationSearchParams(rescore=True, oversampling=args.oversampling)
+                )
+
+            variant_dense = truncate(query_dense, dim)
+            found_dense = [dense_search(name, q, depth, params) for q in variant_dense]
+            found_hybrid = [hybrid_search(name, d, s, depth, params) for d, s in zip(variant_dense, query_sparse)]
+
+            latencies = []
+            for _ in range(ROUNDS):
+                for d, s in zip(variant_dense, query_sparse):
+                    start = time.perf_counter()
+                    hybrid_search(name, d, s, depth, params)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+
+            row = f"{f'{dim}-d {quantization}':<16}"
+            for k in args.k:
+                row += f"{statistics.mean(recall(f, t, k) for f, t in zip(found_dense, truth_dense)):>10.3f}"
+                row += f"{statistics.mean(recall(f, t, k) for f, t in zip(found_hybrid, truth_hybrid)):>11.3f}"
+            row += f"{statistics.median(latencies):>11.2f}{p95:>9.2f}"
+            row += f"{ram_bytes(len(ids), dim, quantization) / 1024 / 1024:>9.2f} MB"
+            print(row)
+
+            qdrant_service.client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the LLM reranker with the local cross-encoder reranker.
+
+For each sample query the hybrid search candidates are reranked by both
+backends, by the LLM in SHARDS concurrent shards and by the cascade; the
+script reports per-backend latency, how many of each variant's top-5
+documents also appear in the single-prompt LLM's top-5, and how often the
+cascade skipped its LLM stage.
+
+No results are recorded yet: the benchmark needs the embedding models, the
+ingested collection and OPENAI_API_KEY, and without network access it stops
+at the model download. RERANKER_BACKEND and RERANK_LLM_SHARDS keep their
+defaults until its numbers are added to the Benchmarks section of the README.
+
+Usage (from the backend directory, with Qdrant and OPENAI_API_KEY configured):
+    python -m benchmarks.rerank_benchmark
+"""
+import asyncio
+import statistics
+import time
+
+from src.config import settings
+from src.services.qdrant_service import qdrant_service
+from src.services.reranker_service import reranker_service
+
+TOP_K = 5
+SHARDS = 4
+
+SAMPLE_QUERIES = [
+    "nồng độ cồn xe máy phạt bao nhiêu",
+    "vượt đèn đỏ ô tô bị phạt thế nào",
+    "không đội mũ bảo hiểm phạt bao nhiêu tiền",
+    "chạy quá tốc độ 20km/h xe máy",
+    "không có bằng lái xe máy bị phạt gì",
+    "đi ngược chiều trên đường một chiều",
+    "dùng điện thoại khi lái ô tô",
+    "chở ba người trên xe máy",
+    "không mang giấy đăng ký xe",
+    "trừ điểm giấy phép lái xe khi vượt đèn đỏ",
+]
+
+
+async def time_rerank(query, candidates, backend, shards=None):
+    start = time.perf_counter()
+    docs = await reranker_service.rerank(query, candidates, TOP_K, backend=backend, shards=shards)
+    return docs, (time.perf_counter() - start) * 1000
+
+
+async def main():
+    latencies = {"llm": [], "llm_sharded": [], "cross_encoder": [], "cascade": []}
+    agreements = []
+    sharded_agreements = []
+    cascade_agreements = []
+
+    # Every variant must really call its backend
+    reranker_service.score_cache = None
+
+    # Warm up the cross-encoder so model loading is not counted
+    await reranker_service.rerank(SAMPLE_QUERIES[0], [{"payload": {"content": "warmup"}}], 1, backend="cross_encoder")
+
+    for query in SAMPLE_QUERIES:
+        candidates = await qdrant_service.hybrid_search_async(query, limit=settings.HYBRID_SEARCH_TOP_K)
+
+        llm_docs, llm_ms = await time_rerank(query, candidates, "llm", shards=1)
+        sharded_docs, sharded_ms = await time_rerank(query, candidates, "llm", shards=SHARDS)
+        ce_docs, ce_ms = await time_rerank(query, candidates, "cross_encoder")
+        cascade_docs, cascade_ms = await time_rerank(query, candidates, "cascade")
+        latencies["cascade"].append(cascade_ms)
+        latencies["llm"].append(llm_ms)
+        latencies["llm_sharded"].append(sharded_ms)
+        latencies["cross_encoder"].append(ce_ms)
+
+        llm_ids = {doc["id"] for doc in llm_docs}
+        ce_ids = {doc["id"] for doc in ce_docs}
+        sharded_ids = {doc["id"] for doc in sharded_docs}
+        agreement = len(llm_ids & ce_ids) / TOP_K
+        agreements.append(agreement)
+        sharded_agreements.append(len(llm_ids & sharded_ids) / TOP_K)
+        cascade_agreements.append(len(llm_ids & {doc["id"] for doc in cascade_docs}) / TOP_K)
+
+        print(
+            f"{query[:45]:<45} llm={llm_ms:8.1f}ms  llm_sharded={sharded_ms:8.1f}ms  "
+            f"cross_encoder={ce_ms:8.1f}ms  cascade={cascade_ms:8.1f}ms  top-{TOP_K} agreement={agreement:.0%}"
+        )
+
+    print("=" * 60)
+    print(f"RERANK BENCHMARK ({len(SAMPLE_QUERIES)} queries, {settings.HYBRID_SEARCH_TOP_K} candidates each)")
+    print("=" * 60)
+    for backend, values in latencies.items():
+        p95 = sorted(values)[max(0, int(len(values) * 0.95) - 1)]
+        print(f"{backend:<14} median={statistics.median(values):8.1f}ms  p95={p95:8.1f}ms")
+    print(f"Mean top-{TOP_K} agreement with llm: cross_encoder {statistics.mean(agreements):.0%}, "
+          f"llm_sharded ({SHARDS} shards) {statistics.mean(sharded_agreements):.0%}, "
+          f"cascade {statistics.mean(cascade_agreements):.0%}")
+    cascade = reranker_service.cascade_stats()
+    print(f"Cascade LLM stage skipped for {cascade['stage2_skipped']}/{cascade['requests']} queries "
+          f"({cascade['stage2_skip_rate']:.0%}), {cascade['stage2_documents']} documents sent to the LLM")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Union
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # Calculate paths
@@ -20,15 +20,149 @@ class Settings(BaseSettings):
     # Qdrant
     QDRANT_URL: str = "http://localhost:6335"
     QDRANT_API_KEY: Union[str, None] = None
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_GRPC_POOL_SIZE: int = 4
+    SEARCH_BACKEND: str = "qdrant"  # "qdrant" or "embedded"
+    EMBEDDED_INDEX_DIR: str = str(ROOT_DIR / "vectorDB" / "embedded_index")
+    DOCUMENT_STORE_DIR: Union[str, None] = None  # local payload store, Qdrant returns payloads when unset
     
     # Reranker & Search
+    RERANKER_BACKEND: str = "llm"  # "llm", "cross_encoder", "cascade", "lexical" or "rrf" (no rerank)
     RERANKER_MODEL: str = "gpt-4.1-mini"
+    CROSS_ENCODER_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    CROSS_ENCODER_BACKEND: str = "onnx"  # sentence-transformers backend: "onnx" or "torch"
+    CROSS_ENCODER_BATCH_SIZE: int = 16
+    CROSS_ENCODER_MAX_LENGTH: int = 512
+    RERANK_LLM_SHARDS: int = 1  # > 1 splits the LLM rerank prompt into concurrent shards
+    RERANK_LLM_CONCURRENCY: int = 8  # concurrent rerank completions across requests
+    RERANK_LLM_SHARD_TIMEOUT_SECONDS: float = 10.0  # shards still running after this are dropped
+    # Cascade backend: local stage 1 on all candidates, LLM on the stage-1 head only when unsure
+    CASCADE_STAGE1_SCORER: str = "lexical"  # "lexical" or "cross_encoder"
+    CASCADE_LLM_TOP_M: int = 12
+    CASCADE_MIN_TOP_SCORE: float = 7.0  # stage-1 scores are on the 0-10 rerank scale
+    CASCADE_CONFIDENCE_GAP: float = 1.5  # score gap between rank top_k and top_k + 1
+    RERANK_CACHE_ENABLED: bool = True  # rerank scores per (query, document, model, prompt)
+    RERANK_CACHE_MAX_ITEMS: int = 50000
+    RERANK_CACHE_TTL_SECONDS: int = 86400
     HYBRID_SEARCH_TOP_K: int = 40
+    # Token budgets of the document context in the rerank prompt (per shard) and the answer prompt
+    RERANK_CONTEXT_MAX_TOKENS: int = 8000
+    ANSWER_CONTEXT_MAX_TOKENS: int = 3000
     RERANK_TOP_K: int = 5
     
+    # Adaptive number of search results sent to the reranker (cut at a clear RRF score gap)
+    ADAPTIVE_DEPTH_ENABLED: bool = True
+    ADAPTIVE_DEPTH_MIN: int = 8
+    ADAPTIVE_DEPTH_MAX: Union[int, None] = None  # all HYBRID_SEARCH_TOP_K results when unset
+    ADAPTIVE_DEPTH_GAP_RATIO: float = 0.3  # minimum score drop, relative to the score above it
+    
+    # Speculative retrieval on the raw user query, reused when the tool query is similar enough
+    SPECULATIVE_RETRIEVAL_ENABLED: bool = True
+    SPECULATIVE_RERANK_ENABLED: bool = False
+    SPECULATIVE_MATCH_THRESHOLD: float = 0.5
+    
+    # Chat history in the agent prompt: recent turns verbatim, older turns as a running summary per session
+    HISTORY_RECENT_TURNS: int = 3
+    HISTORY_MAX_TOKENS: int = 1500  # budget of the verbatim turns
+    HISTORY_SUMMARY_ENABLED: bool = True
+    HISTORY_SUMMARY_MODEL: str = "gpt-4.1-mini"
+    HISTORY_SUMMARY_MAX_WORDS: int = 150
+    
+    # Server-side sessions (turns, history summary, last reranked documents)
+    SESSION_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared, needs the redis package)
+    SESSION_REDIS_URL: str = "redis://localhost:6379/0"
+    SESSION_MAX_ITEMS: int = 10000  # memory backend only
+    SESSION_TTL_SECONDS: int = 24 * 60 * 60
+    SESSION_MAX_TURNS: int = 50  # older turns are dropped (the history summary is then rebuilt)
+    
     # Embedding models
     DENSE_MODEL_NAME: str = "jinaai/jina-embeddings-v3"
     SPARSE_MODEL_NAME: str = "Qdrant/bm25"
+    # Must match the collection built by vectorDB/main.py (--dense-dim, --quantization)
+    DENSE_VECTOR_DIM: Union[int, None] = None  # Matryoshka truncation (e.g. 256/512), full size when unset
+    DENSE_QUANTIZATION: str = "none"  # "none", "scalar" or "binary"
+    DENSE_QUANTIZATION_RESCORE: bool = True
+    DENSE_QUANTIZATION_OVERSAMPLING: float = 2.0
+    EMBEDDING_MAX_WORKERS: int = 1
+    EMBEDDING_MAX_PENDING: int = 64
+    EMBEDDING_THREADS: int = 1  # ONNX Runtime intra-op threads per model
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # micro-batching window, 0 disables batching
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    
+    # Query embedding cache
+    EMBEDDING_CACHE_MAX_ITEMS: int = 4096
+    EMBEDDING_CACHE_MAX_MB: int = 64
+    EMBEDDING_CACHE_DIR: Union[str, None] = None  # shared disk tier, disabled when unset
+    # Disk tier bounds, enforced by sweeps on startup and every few hundred writes; None for no limit
+    EMBEDDING_CACHE_DISK_MAX_MB: Union[int, None] = 512
+    EMBEDDING_CACHE_DISK_TTL_SECONDS: Union[int, None] = 30 * 24 * 60 * 60
+    
+    # Admission control: concurrency, wait queue length and queue-time deadline per stage.
+    # EMBEDDING_MAX_PENDING and RERANK_LLM_CONCURRENCY are the embedding / rerank concurrency.
+    CHAT_MAX_CONCURRENCY: int = 32  # streaming /chat requests
+    CHAT_MAX_QUEUE: int = 64
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    EMBEDDING_MAX_QUEUE: int = 256
+    EMBEDDING_QUEUE_TIMEOUT_SECONDS: float = 5.0
+    QDRANT_MAX_CONCURRENCY: int = 16
+    QDRANT_MAX_QUEUE: int = 128
+    QDRANT_QUEUE_TIMEOUT_SECONDS: float = 5.0
+    RERANK_MAX_QUEUE: int = 64
+    RERANK_QUEUE_TIMEOUT_SECONDS: float = 5.0  # a refused rerank falls back to RRF order
+    LLM_MAX_CONCURRENCY: int = 16  # agent LLM calls
+    LLM_MAX_QUEUE: int = 64
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    
+    # Per-user limits on ChatRequest.user_id: token buckets for requests and agent LLM tokens
+    USER_RATE_LIMIT_ENABLED: bool = True
+    USER_REQUESTS_PER_MINUTE: float = 30
+    USER_REQUEST_BURST: int = 10
+    USER_LLM_TOKENS_PER_MINUTE: float = 60000
+    USER_LLM_TOKEN_BURST: int = 120000
+    USER_WEIGHTS: Dict[str, float] = {}  # fair-queuing weight per user_id for chat slots, 1.0 when absent
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared, needs the redis package)
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_MAX_USERS: int = 100000  # memory backend only
+    
+    # Load-adaptive degradation: full -> local_rerank -> rrf_only -> cache_only, one mode at a time.
+    # Pressure is the worst stage ratio of queue fill, p95 queue wait / DEGRADATION_MAX_WAIT_SECONDS
+    # and p95 call latency / DEGRADATION_LATENCY_TARGETS_SECONDS over the last window.
+    DEGRADATION_ENABLED: bool = True
+    DEGRADATION_MODE: Union[str, None] = None  # pin a mode, automatic when unset
+    DEGRADATION_INTERVAL_SECONDS: float = 1.0
+    DEGRADATION_WINDOW_SECONDS: float = 30.0
+    DEGRADATION_MAX_WAIT_SECONDS: float = 2.0
+    DEGRADATION_LATENCY_TARGETS_SECONDS: Dict[str, float] = {"embedding": 1.0, "qdrant": 1.0, "rerank": 8.0, "llm": 20.0}
+    DEGRADATION_ESCALATE_PRESSURE: float = 1.0  # one mode down after this pressure for DEGRADATION_ESCALATE_SECONDS
+    DEGRADATION_ESCALATE_SECONDS: float = 5.0
+    DEGRADATION_RECOVER_PRESSURE: float = 0.5  # one mode up after this pressure for DEGRADATION_RECOVER_SECONDS
+    DEGRADATION_RECOVER_SECONDS: float = 30.0
+    DEGRADED_RERANKER_BACKEND: str = "lexical"  # reranker of the local_rerank mode: "lexical" or "cross_encoder"
+    DEGRADED_SEARCH_TOP_K: int = 15  # hybrid search results in the rrf_only and cache_only modes
+    
+    # Per-request agent budget: search rounds (tools -> rerank) and a deadline from the start of the agent run.
+    # As the deadline nears, searches return fewer results and rerank gets cheaper, then is skipped;
+    # once the rounds are used up or too little time is left, the agent must answer without searching.
+    AGENT_MAX_TOOL_ITERATIONS: int = 3
+    AGENT_DEADLINE_SECONDS: float = 60.0
+    AGENT_DEADLINE_SHRINK_SECONDS: float = 30.0  # time left under which searches use DEGRADED_SEARCH_TOP_K and a local rerank
+    AGENT_DEADLINE_SKIP_RERANK_SECONDS: float = 20.0  # time left under which the search order is kept
+    AGENT_DEADLINE_ANSWER_SECONDS: float = 10.0  # time left under which the agent must answer
+    
+    # Identical concurrent requests share one agent run
+    SINGLE_FLIGHT_ENABLED: bool = True
+    
+    # Semantic answer cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ITEMS: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    
+    # Corpus identity, used to invalidate cached answers after re-ingestion.
+    # When unset, the version vectorDB/main.py writes into the collection is re-read periodically
+    CORPUS_VERSION: Union[str, None] = None
+    CORPUS_VERSION_REFRESH_SECONDS: int = 60
     
     # Constants
     ERROR_MESSAGE: str = "We are facing an issue, please try after sometimes."
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import StreamingResponse
 
 from src.schemas.chat import ChatRequest
+from src.services.admission import admission
 from src.services.agent_service import agent_service
+from src.services.rate_limiter import rate_limiter
+from src.services.session_store import session_store
+from src.utils.limiter import Overloaded
 from src.config import settings
 
 router = APIRouter(
@@ -11,9 +17,22 @@ router = APIRouter(
 )
 
 
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that gives back its chat admission slot once sent, or when the client disconnects."""
+
+    def __init__(self, content, granted: float, **kwargs):
+        super().__init__(content, **kwargs)
+        self.granted = granted
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.stage("chat").release(self.granted)
+
 
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, x_session_id: Optional[str] = Header(None)):
     """
     Chat endpoint for traffic law Q&A.
     
@@ -23,22 +42,63 @@ async def chat(request: ChatRequest):
     - For greetings: Respond directly
     - For unrelated questions: Politely refuse
     
-    Returns streaming response.
+    The conversation is kept server-side per session (X-Session-Id header,
+    session_id or user_id), so clients only need to send the new query.
+    Clients that send chat_history keep working; their history is used
+    as is and replaces the stored one.
+    
+    Requests over CHAT_MAX_CONCURRENCY wait in a bounded queue, served
+    fairly across users; when it is full the answer is 429, when the wait
+    times out 503. Admitted requests are then limited per user_id in
+    requests and LLM tokens per minute (429). All refusals carry Retry-After.
+    
+    Returns streaming response, with the session id in the X-Session-Id header.
     """
     try:
+        granted = await admission.stage("chat").acquire(
+            key=request.user_id,
+            weight=rate_limiter.weight(request.user_id)
+        )
+        # Only requests the chat stage admitted take a request token
+        try:
+            await rate_limiter.admit(request.user_id)
+        except BaseException:
+            admission.stage("chat").release(granted)
+            raise
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    try:
+        session_id = x_session_id or request.session_id or request.user_id
+        
         # Convert chat history to the expected format
-        chat_history = []
-        if request.chat_history:
+        chat_history = None
+        if request.chat_history is not None:
+            chat_history = []
             for item in request.chat_history:
                 chat_history.append({
                     "query": item.query,
                     "response": item.response
                 })
         
-        return StreamingResponse(
-            agent_service.process_query(request.query, chat_history),
-            media_type="text/event-stream"
+        return _AdmittedStreamingResponse(
+            agent_service.process_query(request.query, chat_history, session_id, request.user_id),
+            granted,
+            media_type="text/event-stream",
+            headers={"X-Session-Id": session_id}
         )
         
     except Exception as e:
+        admission.stage("chat").release(granted)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a session's turns, summary and documents, to start a new conversation."""
+    await session_store.delete(session_id)
+    return {"status": "deleted", "session_id": session_id}
@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 
+from src.services.degradation import degradation
+
 router = APIRouter(
     prefix="/api/health",
     tags=["Health Check"]
@@ -8,5 +10,5 @@ router = APIRouter(
 
 @router.get("")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy", "message": "Service is running"}
+    """Health check endpoint, with the current degradation mode."""
+    return {"status": "healthy", "message": "Service is running", "mode": degradation.mode}
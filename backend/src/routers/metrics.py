@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+
+from src.services.admission import admission
+from src.services.answer_cache import answer_cache
+from src.services.degradation import degradation
+from src.services.history_manager import history_manager
+from src.services.qdrant_service import qdrant_service
+from src.services.rate_limiter import rate_limiter
+from src.services.reranker_service import reranker_service
+from src.services.session_store import session_store
+from src.services.single_flight import single_flight
+
+router = APIRouter(
+    prefix="/api/metrics",
+    tags=["Metrics"]
+)
+
+
+@router.get("")
+async def metrics():
+    """Admission queues per stage, cache hit rates and pipeline counters."""
+    embedding = {"cache": qdrant_service.embedding_cache.stats()}
+    if qdrant_service.embedding_batcher is not None:
+        embedding["batcher"] = qdrant_service.embedding_batcher.stats()
+
+    rerank = {"cascade": reranker_service.cascade_stats()}
+    if reranker_service.score_cache is not None:
+        rerank["cache"] = reranker_service.score_cache.stats()
+
+    return {
+        "degradation": degradation.stats(),
+        "admission": admission.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "embedding": embedding,
+        "rerank": rerank,
+        "answer_cache": answer_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "sessions": session_store.stats(),
+        "history": history_manager.stats(),
+    }
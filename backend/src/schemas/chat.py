@@ -9,8 +9,11 @@ class ChatHistory(BaseModel):
 
 class ChatRequest(BaseModel):
     query: str
-    chat_history: Optional[List[ChatHistory]] = []
+    # Omit to continue the server-side session; sent history replaces the stored turns
+    chat_history: Optional[List[ChatHistory]] = None
     user_id: str
+    # Session to continue (also accepted as the X-Session-Id header), defaults to user_id
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
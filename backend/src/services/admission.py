@@ -0,0 +1,68 @@
+import logging
+from typing import Any, Dict
+
+from src.config import settings
+from src.utils.limiter import FairStageLimiter, StageLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Admission control for the chat pipeline: one StageLimiter per stage.
+
+    - chat: whole /chat requests, held while the answer streams; waiters
+      are served by weighted fair queuing on user_id
+    - embedding: query embedding calls that miss the memory cache
+    - qdrant: Qdrant queries
+    - rerank: reranker model calls (LLM completions or cross-encoder batches)
+    - llm: agent LLM calls
+
+    Requests over the chat limit are refused before streaming starts, with
+    429/503 and Retry-After. Inner stages protect the shared backends from
+    the requests already admitted; a refused rerank falls back to RRF order,
+    other refusals end the request with a "busy" answer.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self.stages: Dict[str, StageLimiter] = {
+            "chat": FairStageLimiter(
+                "chat", settings.CHAT_MAX_CONCURRENCY, settings.CHAT_MAX_QUEUE, settings.CHAT_QUEUE_TIMEOUT_SECONDS
+            ),
+            "embedding": StageLimiter(
+                "embedding", settings.EMBEDDING_MAX_PENDING, settings.EMBEDDING_MAX_QUEUE,
+                settings.EMBEDDING_QUEUE_TIMEOUT_SECONDS
+            ),
+            "qdrant": StageLimiter(
+                "qdrant", settings.QDRANT_MAX_CONCURRENCY, settings.QDRANT_MAX_QUEUE,
+                settings.QDRANT_QUEUE_TIMEOUT_SECONDS
+            ),
+            "rerank": StageLimiter(
+                "rerank", settings.RERANK_LLM_CONCURRENCY, settings.RERANK_MAX_QUEUE,
+                settings.RERANK_QUEUE_TIMEOUT_SECONDS
+            ),
+            "llm": StageLimiter(
+                "llm", settings.LLM_MAX_CONCURRENCY, settings.LLM_MAX_QUEUE, settings.LLM_QUEUE_TIMEOUT_SECONDS
+            ),
+        }
+        self._initialized = True
+
+    def stage(self, name: str) -> StageLimiter:
+        return self.stages[name]
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
+
+
+# Singleton instance
+admission = AdmissionController()
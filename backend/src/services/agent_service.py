@@ -1,25 +1,64 @@
 import logging
 import json
 import asyncio
-from typing import List, Dict, Any, AsyncGenerator, Annotated, Optional
+import hashlib
+import operator
+import re
+import time
+from contextlib import aclosing
+from typing import List, Dict, Any, AsyncGenerator, Annotated, Optional, Tuple
 
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, BaseMessage
-from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from pydantic import BaseModel, ConfigDict, Field
 from typing_extensions import TypedDict
 
 from src.config import settings
+from src.services.admission import admission
+from src.services.answer_cache import answer_cache
+from src.services.degradation import degradation
+from src.services.history_manager import history_manager
 from src.services.qdrant_service import qdrant_service
+from src.services.rate_limiter import rate_limiter
 from src.services.reranker_service import reranker_service
+from src.services.session_store import session_store
+from src.services.single_flight import single_flight
+from src.services.speculative_retrieval import SpeculativeRetrieval
+from src.utils.candidates import select_candidates
+from src.utils.context_builder import build_context, count_tokens
+from src.utils.limiter import Overloaded
 from src.utils.prompt_manager import prompt_manager
+from src.utils.text import normalize_query
 
 logger = logging.getLogger(__name__)
 
 
-@tool
-def search_traffic_law_db(query: str) -> str:
+def _search_filters(tool_args: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Payload filters from the optional year/article tool arguments, normalized to the stored strings."""
+    filters = {}
+    # Accept "2024", 2024 or "168/2024" for the year and "6" or "Điều 6" for the article
+    year = re.search(r"(?:19|20)\d{2}", str(tool_args.get("year") or ""))
+    if year:
+        filters["year"] = year.group()
+    article = re.search(r"\d+", str(tool_args.get("article") or ""))
+    if article:
+        filters["article"] = article.group()
+    return filters or None
+
+
+def _flight_key(query: str, chat_history: List[Dict[str, str]], history_summary: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """Requests with the same normalized query and the same history get the same answer."""
+    history = json.dumps(
+        [chat_history, (history_summary or {}).get("summary")],
+        ensure_ascii=False
+    )
+    return normalize_query(query), hashlib.sha256(history.encode("utf-8")).hexdigest()
+
+
+class SearchTrafficLawDb(BaseModel):
     """
     Search for information in the Vietnamese traffic law database.
     Use this tool when the user asks about:
@@ -27,29 +66,62 @@ def search_traffic_law_db(query: str) -> str:
     - Regulations on driver's licenses, vehicle registration
     - Road traffic rules
     - Decrees 100/2019, 123/2021, 168/2024 on traffic violation penalties
-    
-    Args:
-        query: Question or search keywords about traffic law
-        
-    Returns:
-        Relevant documents from the traffic law database
     """
-    logger.info(f"Searching traffic law DB for: {query}")
-    search_results = qdrant_service.hybrid_search(query, limit=settings.HYBRID_SEARCH_TOP_K)
-    
-    if not search_results:
-        return "No relevant documents found in the database."
-    
-    return json.dumps(search_results, ensure_ascii=False)
+    # Tool schema bound to the LLM; the calls are run by AgentService._tool_node
+    # (batched, reusing speculative retrieval) and answered by _rerank_node
+    model_config = ConfigDict(title="search_traffic_law_db")
+
+    query: str = Field(description="Question or search keywords about traffic law")
+    year: Optional[str] = Field(
+        default=None,
+        description=(
+            'Only search this decree year: "2019" (Decree 100/2019), "2021" (Decree 123/2021) '
+            'or "2024" (Decree 168/2024). Leave empty unless the user names a decree or year.'
+        ),
+    )
+    article: Optional[str] = Field(
+        default=None,
+        description='Only search this article number, e.g. "6". Leave empty unless the user names an article.',
+    )
 
 
 class AgentState(TypedDict):
     """State definition for the LangGraph agent."""
     messages: Annotated[list, add_messages]
-    search_results: List[Dict[str, Any]]
+    # One entry per search tool call of the last agent turn:
+    # {"tool_call_id", "query", "filters", "results", "speculative"}
+    searches: List[Dict[str, Any]]
     reranked_docs: List[Dict[str, Any]]
     tool_calls_info: List[Dict[str, Any]]
-    last_tool_call_id: Optional[str]
+    speculation: Optional[SpeculativeRetrieval]
+    # User who started the run, charged for its agent LLM calls; tokens used so far
+    user_id: Optional[str]
+    llm_tokens: Annotated[int, operator.add]
+    # Budget: monotonic deadline of the run, search rounds done, whether the answer was forced
+    deadline: float
+    tool_iterations: int
+    forced_answer: bool
+    # Whether a rerank fell back or used a cheaper backend (degraded mode, deadline, error)
+    degraded: bool
+
+
+def _llm_usage(messages: List[BaseMessage], response: Optional[AIMessage]) -> int:
+    """
+    Tokens of one agent LLM call: as reported by the API, or estimated from
+    the texts (only the prompt when the call was cut off without a response).
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        return usage["total_tokens"]
+    texts = [str(message.content) for message in messages]
+    if response is not None:
+        texts.append(str(response.content))
+        texts += [json.dumps(tool_call.get("args", {}), ensure_ascii=False) for tool_call in response.tool_calls]
+    return sum(count_tokens(text) for text in texts)
+
+
+def _time_left(state: AgentState) -> float:
+    return state["deadline"] - time.monotonic()
 
 
 class AgentService:
@@ -60,10 +132,12 @@ class AgentService:
             api_key=settings.OPENAI_API_KEY,
             temperature=0,
             streaming=True,
+            # Token usage of streamed calls, for the per-user LLM token limit
+            stream_usage=True,
         )
         
         # Define tools
-        self.tools = [search_traffic_law_db]
+        self.tools = [SearchTrafficLawDb]
         
         # Bind tools to LLM
         self.llm_with_tools = self.llm.bind_tools(self.tools)
@@ -97,21 +171,54 @@ class AgentService:
         
         return graph_builder.compile()
     
-    async def _agent_node(self, state: AgentState) -> dict:
-        """Agent node that decides whether to call tools or respond."""
+    async def _agent_node(self, state: AgentState, config: RunnableConfig) -> dict:
+        """Agent node that decides whether to call tools or respond; without tools once the budget is spent."""
         messages = state["messages"]
-        response = await self.llm_with_tools.ainvoke(messages)
-        return {"messages": [response]}
+        time_left = _time_left(state)
+        llm = self.llm_with_tools
+        forced_answer = (
+            state["tool_iterations"] >= settings.AGENT_MAX_TOOL_ITERATIONS
+            or time_left < settings.AGENT_DEADLINE_ANSWER_SECONDS
+        )
+        if forced_answer:
+            logger.info(
+                f"Agent budget spent ({state['tool_iterations']} search rounds, {time_left:.1f}s left): forcing an answer"
+            )
+            llm = self.llm
+            messages = messages + [SystemMessage(content=prompt_manager.render("agent_budget_prompt.jinja2"))]
+        
+        # Wait for an LLM slot no longer than the time left
+        timeout = min(settings.LLM_QUEUE_TIMEOUT_SECONDS, max(time_left, 0.0))
+        sent = False
+        response = None
+        llm_tokens = 0
+        try:
+            # Pass the config through so token chunks reach the "messages" stream (needed on Python < 3.11)
+            async with admission.stage("llm").slot(timeout):
+                sent = True
+                response = await llm.ainvoke(messages, config)
+        finally:
+            # Charged even when the call fails or is cancelled (all clients gone): the prompt was sent
+            if sent:
+                llm_tokens = _llm_usage(messages, response)
+                if state.get("user_id"):
+                    await rate_limiter.charge_llm_tokens(state["user_id"], llm_tokens)
+        return {
+            "messages": [response],
+            "llm_tokens": llm_tokens,
+            "forced_answer": forced_answer
+        }
     
     async def _tool_node(self, state: AgentState) -> dict:
-        """Execute tools and store results."""
+        """Execute all tool calls of the last agent turn and store their results."""
         messages = state["messages"]
         last_message = messages[-1]
         
         tool_calls_info = list(state.get("tool_calls_info", []))
-        search_results = []
+        speculation = state.get("speculation")
+        searches = []
+        search_infos = []
         tool_messages = []
-        last_tool_call_id = None
         
         if hasattr(last_message, "tool_calls") and last_message.tool_calls:
             for tool_call in last_message.tool_calls:
@@ -129,44 +236,69 @@ class AgentService:
                 }
                 tool_calls_info.append(tool_info)
                 
-                # Execute the tool
                 if tool_name == "search_traffic_law_db":
-                    result = search_traffic_law_db.invoke(tool_args)
-                    try:
-                        search_results = json.loads(result)
-                    except json.JSONDecodeError:
-                        search_results = []
-                    
-                    # Update tool info with result count
-                    tool_info["content"] = f"Found {len(search_results)} results"
-                    last_tool_call_id = tool_call_id
-                    
-                    # Don't add ToolMessage here, let rerank_node do it with formatted context
+                    searches.append({
+                        "tool_call_id": tool_call_id,
+                        "query": tool_args.get("query", ""),
+                        "filters": _search_filters(tool_args),
+                        "results": [],
+                        "speculative": False
+                    })
+                    search_infos.append(tool_info)
+                else:
+                    # Every tool call needs an answer, or the next LLM call is rejected
+                    tool_info["content"] = f"Unknown tool: {tool_name}"
+                    tool_messages.append(ToolMessage(
+                        content=f"Unknown tool: {tool_name}",
+                        tool_call_id=tool_call_id
+                    ))
+        
+        # Fewer results in the rrf_only / cache_only modes, or close to the deadline
+        limit = degradation.search_top_k()
+        if _time_left(state) < settings.AGENT_DEADLINE_SHRINK_SECONDS:
+            limit = min(limit, settings.DEGRADED_SEARCH_TOP_K)
         
+        # Reuse the search started on the raw user query for the first close enough tool query
+        pending = []
+        for search in searches:
+            if speculation is not None and not any(s["speculative"] for s in searches) and speculation.matches(
+                search["query"], limit, search["filters"]
+            ):
+                speculative_results = await speculation.search_results()
+                if speculative_results is not None:
+                    search["results"] = speculative_results
+                    search["speculative"] = True
+                    continue
+            pending.append(search)
+        
+        # Run the remaining searches concurrently as one batched round trip
+        if pending:
+            batch_results = await qdrant_service.hybrid_search_batch_async(
+                [search["query"] for search in pending],
+                limit=limit,
+                filters=[search["filters"] for search in pending]
+            )
+            for search, results in zip(pending, batch_results):
+                search["results"] = results
+        
+        # Update tool info with result count
+        for search, tool_info in zip(searches, search_infos):
+            tool_info["content"] = f"Found {len(search['results'])} results"
+        
+        # Don't add ToolMessages for searches here, let rerank_node do it with formatted context
         return {
-            "search_results": search_results,
+            "messages": tool_messages,
+            "searches": searches,
             "tool_calls_info": tool_calls_info,
-            "last_tool_call_id": last_tool_call_id
+            "tool_iterations": state["tool_iterations"] + 1
         }
     
     async def _rerank_node(self, state: AgentState) -> dict:
-        """Rerank search results and return formatted context as ToolMessage."""
-        search_results = state.get("search_results", [])
+        """Rerank each search's results and answer each search tool call with a ToolMessage."""
+        searches = state.get("searches", [])
         tool_calls_info = list(state.get("tool_calls_info", []))
-        last_tool_call_id = state.get("last_tool_call_id")
-        
-        if not search_results or not last_tool_call_id:
-            logger.warning("No search results or tool_call_id found for reranking")
-            # Still need to return a ToolMessage to satisfy the agent
-            if last_tool_call_id:
-                return {
-                    "messages": [ToolMessage(
-                        content="No relevant documents found.",
-                        tool_call_id=last_tool_call_id
-                    )],
-                    "reranked_docs": [],
-                    "tool_calls_info": tool_calls_info
-                }
+        
+        if not searches:
             return {"reranked_docs": [], "tool_calls_info": tool_calls_info}
         
         # Get the original query from messages (last HumanMessage)
@@ -176,78 +308,118 @@ class AgentService:
                 query = msg.content
                 break
         
-        logger.info(f"Reranking {len(search_results)} results for query: {query[:50]}...")
+        backend = self._rerank_backend(_time_left(state))
         
-        # Add rerank tool info
-        rerank_info = {
-            "name": "rerank",
-            "args": {"model": settings.RERANKER_MODEL, "top_k": settings.RERANK_TOP_K},
-            "content": "Processing..."
+        # Add one rerank tool info per search, in tool call order
+        rerank_infos = []
+        for _ in searches:
+            rerank_info = {
+                "name": "rerank",
+                "args": {
+                    "backend": backend,
+                    "model": reranker_service.model_for(backend),
+                    "top_k": settings.RERANK_TOP_K,
+                    "mode": degradation.mode
+                },
+                "content": "Processing..."
+            }
+            tool_calls_info.append(rerank_info)
+            rerank_infos.append(rerank_info)
+        
+        outcomes = await asyncio.gather(*[
+            self._rerank_search(query, search, rerank_info, state.get("speculation"), state.get("user_id"))
+            for search, rerank_info in zip(searches, rerank_infos)
+        ])
+        
+        tool_messages = [tool_message for tool_message, _ in outcomes]
+        reranked_docs = [doc for _, docs in outcomes for doc in docs]
+        degraded = (
+            backend != reranker_service.backend
+            or any(doc.get("rerank_fallback") for doc in reranked_docs)
+            or any(search["results"] and not docs for search, (_, docs) in zip(searches, outcomes))
+        )
+        
+        return {
+            "messages": tool_messages,
+            "reranked_docs": reranked_docs,
+            "tool_calls_info": tool_calls_info,
+            "degraded": state.get("degraded", False) or degraded
         }
-        tool_calls_info.append(rerank_info)
+    
+    async def _rerank_search(
+        self,
+        query: str,
+        search: Dict[str, Any],
+        rerank_info: Dict[str, Any],
+        speculation: Optional[SpeculativeRetrieval],
+        user_id: Optional[str] = None
+    ) -> Tuple[ToolMessage, List[Dict[str, Any]]]:
+        """Rerank one search's results and build its ToolMessage."""
+        search_results = search["results"]
+        tool_call_id = search["tool_call_id"]
+        
+        if not search_results:
+            logger.warning(f"No search results found for reranking (query: {search['query'][:50]})")
+            rerank_info["content"] = "No documents to rerank"
+            return ToolMessage(
+                content="No relevant documents found.",
+                tool_call_id=tool_call_id
+            ), []
+        
+        logger.info(f"Reranking {len(search_results)} results for query: {query[:50]}...")
         
         try:
-            # Perform reranking
-            reranked_docs = await reranker_service.rerank(
-                query,
-                search_results,
-                settings.RERANK_TOP_K
-            )
+            # Perform reranking, unless it already ran speculatively on these results with the same backend
+            reranked_docs = None
+            if speculation is not None and search["speculative"]:
+                reranked_docs = await speculation.reranked_docs(query, rerank_info["args"]["backend"])
+            if reranked_docs is None:
+                candidates, depth_info = select_candidates(search_results, query)
+                rerank_info["args"]["candidates"] = depth_info["depth"]
+                reranked_docs = await reranker_service.rerank(
+                    query,
+                    candidates,
+                    settings.RERANK_TOP_K,
+                    backend=rerank_info["args"]["backend"],
+                    user_id=user_id
+                )
             
             # Update rerank info
             rerank_info["content"] = f"Selected top {len(reranked_docs)} most relevant documents"
             logger.info(f"Reranking completed: {len(reranked_docs)} documents selected")
             
             # Format context for the agent
-            context = self._format_context(reranked_docs)
+            context = self._format_context(reranked_docs, query)
             
             # Create ToolMessage with formatted context
-            tool_message = ToolMessage(
+            return ToolMessage(
                 content=f"Reference documents:\n{context}",
-                tool_call_id=last_tool_call_id
-            )
-            
-            return {
-                "messages": [tool_message],
-                "reranked_docs": reranked_docs,
-                "tool_calls_info": tool_calls_info
-            }
+                tool_call_id=tool_call_id
+            ), reranked_docs
             
         except Exception as e:
             logger.error(f"Error during reranking: {e}", exc_info=True)
             rerank_info["content"] = f"Error during reranking: {str(e)}"
             
             # Return a ToolMessage with error info
-            return {
-                "messages": [ToolMessage(
-                    content=f"Error processing documents: {str(e)}",
-                    tool_call_id=last_tool_call_id
-                )],
-                "reranked_docs": [],
-                "tool_calls_info": tool_calls_info
-            }
+            return ToolMessage(
+                content=f"Error processing documents: {str(e)}",
+                tool_call_id=tool_call_id
+            ), []
     
-    def _format_context(self, documents: List[Dict[str, Any]]) -> str:
-        """Format retrieved documents into context string."""
-        context_parts = []
-        
-        for i, doc in enumerate(documents, 1):
-            payload = doc.get("payload", {})
-            year = payload.get("year", "")
-            article = payload.get("article", "")
-            title = payload.get("title", "")
-            content = payload.get("content", "")
-            
-            context_part = f"""
---- Document {i} ---
-Year: {year}
-Article: {article}
-Title: {title}
-Content: {content}
-"""
-            context_parts.append(context_part)
-        
-        return "\n".join(context_parts)
+    @staticmethod
+    def _rerank_backend(time_left: float) -> str:
+        """Reranker backend: cheaper in the degraded modes and as the deadline nears."""
+        backend = degradation.rerank_backend() or reranker_service.backend
+        if time_left < settings.AGENT_DEADLINE_SKIP_RERANK_SECONDS:
+            return "rrf"
+        if time_left < settings.AGENT_DEADLINE_SHRINK_SECONDS and backend in ("llm", "cascade"):
+            return settings.DEGRADED_RERANKER_BACKEND
+        return backend
+    
+    def _format_context(self, documents: List[Dict[str, Any]], query: str = "") -> str:
+        """Format retrieved documents into a token-budgeted context string."""
+        return build_context(query, documents, settings.ANSWER_CONTEXT_MAX_TOKENS, start_index=1)["text"]
     
     def _should_continue(self, state: AgentState) -> str:
         """Determine if we should continue to tools or end."""
@@ -263,7 +435,9 @@ Content: {content}
     async def process_query(
         self,
         query: str,
-        chat_history: List[Dict[str, str]] = None
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """
         Process a user query through the Agent pipeline.
@@ -273,45 +447,217 @@ Content: {content}
         2. If yes: search -> rerank -> generate response with context
         3. If no: respond directly (greetings or refuse non-traffic questions)
         
+        Standalone questions (no chat history) are first looked up in the
+        semantic answer cache; a hit replays the cached events instead. In
+        the cache_only degradation mode, misses get a busy answer. Answers
+        that were degraded or forced by the budget are not cached.
+        Only the recent part of the chat history is replayed, older turns
+        are summarized per session (see HistoryManager). Each finished turn
+        is stored in the session with the documents it was based on.
+        
+        Identical requests running at the same time (same normalized query
+        and history) share one agent run; each gets a copy of its events.
+        
         Args:
             query: User's question
-            chat_history: Previous conversation history
+            chat_history: Previous conversation history; None to use the session's turns
+            session_id: Server-side session of the conversation
+            user_id: User charged for the LLM tokens of the agent run (not when joining an identical running one)
             
         Yields:
-            Streaming chunks with type indicators
+            Streaming chunks with type indicators: tool_name/tool_args/tool_content
+            for each tool step, answer_delta for each generated answer token
+            (answer_reset when the text turns out to precede a tool call), a
+            budget chunk with the search rounds and time used, then a final
+            answer chunk with the full text
         """
         try:
-            # Build system prompt
-            system_content = prompt_manager.render("agent_system_prompt.jinja2")
+            session = await session_store.load(session_id)
+            # Turns trimmed before the history; a history sent by the client starts the conversation
+            history_offset = 0
+            if chat_history is None:
+                chat_history = session["turns"]
+                history_offset = session["offset"]
             
-            # Build messages
-            messages = [SystemMessage(content=system_content)]
+            use_cache = settings.ANSWER_CACHE_ENABLED and not chat_history
+            query_embedding = None
+            if use_cache:
+                query_embedding, _ = await qdrant_service.embed_query_async(query)
+                cached_events = answer_cache.lookup(query, query_embedding)
+                if cached_events is not None:
+                    for event in cached_events:
+                        yield json.dumps(event) + "\n"
+                        if event["type"] == "answer":
+                            await session_store.save_turn(
+                                session_id, chat_history, query, event["content"], offset=history_offset
+                            )
+                    return
             
-            # Add chat history
-            if chat_history:
-                for item in chat_history:
-                    messages.append(HumanMessage(content=item.get("query", "")))
-                    messages.append(AIMessage(content=item.get("response", "")))
+            if degradation.cache_only():
+                logger.warning("Cache-only mode, answer cache missed: refusing the request")
+                yield json.dumps({
+                    "type": "answer",
+                    "content": "Sorry, the service is busy, please try again in "
+                               f"{int(settings.DEGRADATION_RECOVER_SECONDS)} seconds."
+                }) + "\n"
+                return
             
-            # Add current query
-            messages.append(HumanMessage(content=query))
+            full_answer = ""
+            reranked_docs = []
             
-            # Initialize state
-            initial_state = {
-                "messages": messages,
-                "search_results": [],
-                "reranked_docs": [],
-                "tool_calls_info": [],
-                "last_tool_call_id": None
-            }
+            # Runs once per shared run, so the answer of a shared run is cached once
+            async def run_agent():
+                # Events worth replaying from the cache (token deltas are folded into the answer)
+                recorded_events = []
+                budget = {}
+                agent_events = self._run_agent(
+                    query, chat_history, session_id, session["summary"], history_offset, user_id
+                )
+                async with aclosing(agent_events):
+                    async for event in agent_events:
+                        yield event
+                        if event["type"] == "budget":
+                            budget = event["content"]
+                        elif event["type"] not in ("answer_delta", "answer_reset", "reranked_docs"):
+                            recorded_events.append(event)
+                # Answers from a degraded rerank or a spent budget are not kept for the whole TTL
+                answered = any(event["type"] == "answer" for event in recorded_events)
+                if use_cache and answered and not (budget.get("forced_answer") or budget.get("degraded")):
+                    answer_cache.store(query, query_embedding, recorded_events)
             
-            # Track tool calls that we've already sent to frontend
-            sent_tool_indices = set()
-            full_answer = ""
+            if settings.SINGLE_FLIGHT_ENABLED:
+                events = single_flight.subscribe(_flight_key(query, chat_history, session["summary"]), run_agent)
+            else:
+                events = run_agent()
+            
+            # Closed explicitly when the client disconnects, so a shared run knows one subscriber left
+            async with aclosing(events):
+                async for event in events:
+                    # Internal event: kept in the session, not streamed
+                    if event["type"] == "reranked_docs":
+                        reranked_docs = event["content"]
+                        continue
+                    yield json.dumps(event) + "\n"
+                    if event["type"] == "answer":
+                        full_answer = event["content"]
+            
+            if not full_answer:
+                yield json.dumps({
+                    "type": "answer",
+                    "content": "Sorry, an error occurred while processing your request."
+                }) + "\n"
+            else:
+                await session_store.save_turn(
+                    session_id, chat_history, query, full_answer, reranked_docs, offset=history_offset
+                )
+                history_manager.record_turn(
+                    chat_history, query, full_answer, session_id, session["summary"], history_offset, user_id
+                )
+                
+        except Overloaded as e:
+            logger.warning(f"Agent pipeline refused: {e}")
+            yield json.dumps({
+                "type": "answer",
+                "content": f"Sorry, the service is busy, please try again in {e.retry_after} seconds."
+            }) + "\n"
+        except Exception as e:
+            logger.error(f"Error in Agent pipeline: {e}", exc_info=True)
+            yield json.dumps({
+                "type": "answer",
+                "content": f"Sorry, an error occurred: {str(e)}"
+            }) + "\n"
+    
+    async def _run_agent(
+        self,
+        query: str,
+        chat_history: List[Dict[str, str]] = None,
+        session_id: Optional[str] = None,
+        history_summary: Optional[Dict[str, Any]] = None,
+        history_offset: int = 0,
+        user_id: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Run the agent graph and yield stream events as dicts.
+        
+        The run has AGENT_MAX_TOOL_ITERATIONS search rounds and
+        AGENT_DEADLINE_SECONDS; once either is spent the agent answers with
+        the documents it has. After the graph, a budget event reports what
+        was used. The agent, rerank and history summary LLM calls are
+        charged to `user_id` as they finish. When the agent produced an answer, ends with an internal
+        reranked_docs event with the documents of the last rerank and the
+        final answer event.
+        """
+        # Build system prompt
+        system_content = prompt_manager.render("agent_system_prompt.jinja2")
+        
+        # Build messages
+        messages = [SystemMessage(content=system_content)]
+        
+        # Add chat history: summary of older turns, then the recent turns verbatim
+        history_messages, _ = history_manager.build_messages(
+            chat_history, session_id, history_summary, history_offset, user_id
+        )
+        messages.extend(history_messages)
+        
+        # Add current query
+        messages.append(HumanMessage(content=query))
+        
+        # Initialize state
+        started = time.monotonic()
+        initial_state = {
+            "messages": messages,
+            "searches": [],
+            "reranked_docs": [],
+            "tool_calls_info": [],
+            "speculation": None,
+            "user_id": user_id,
+            "llm_tokens": 0,
+            "deadline": started + settings.AGENT_DEADLINE_SECONDS,
+            "tool_iterations": 0,
+            "forced_answer": False,
+            "degraded": False
+        }
+        
+        # Start retrieval on the raw query while the agent decides whether to search
+        if settings.SPECULATIVE_RETRIEVAL_ENABLED:
+            initial_state["speculation"] = SpeculativeRetrieval(
+                query,
+                limit=degradation.search_top_k(),
+                rerank=settings.SPECULATIVE_RERANK_ENABLED,
+                user_id=user_id
+            )
+        
+        # Track tool calls that we've already sent to frontend
+        sent_tool_indices = set()
+        full_answer = ""
+        # Whether answer_delta text of the current agent turn has been sent
+        streamed_text = False
+        reranked_docs = []
+        llm_tokens = 0
+        tool_iterations = 0
+        forced_answer = False
+        degraded = False
+        
+        try:
+            # "updates" carries node outputs (tool info, final message),
+            # "messages" carries LLM tokens as they are generated
+            async for mode, event in self.graph.astream(initial_state, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    chunk, metadata = event
+                    if metadata.get("langgraph_node") != "agent":
+                        continue
+                    # Text the model writes before deciding to call a tool is not the answer:
+                    # once the turn turns out to be a tool call, the client discards what it got
+                    if getattr(chunk, "tool_call_chunks", None):
+                        if streamed_text:
+                            streamed_text = False
+                            yield {"type": "answer_reset", "content": ""}
+                    elif chunk.content:
+                        streamed_text = True
+                        yield {"type": "answer_delta", "content": chunk.content}
+                    continue
             
-            # Use astream to get state updates, then stream final response separately
-            async for event in self.graph.astream(initial_state, stream_mode="updates"):
-                # Each event is a dict with node name as key
+                # Each update is a dict with node name as key
                 for node_name, output in event.items():
                     # Send tool call info to frontend
                     if isinstance(output, dict):
@@ -319,12 +665,21 @@ Content: {content}
                         for i, tool_info in enumerate(tool_calls_info):
                             if i not in sent_tool_indices:
                                 sent_tool_indices.add(i)
-                                yield json.dumps({"type": "tool_name", "content": tool_info["name"]}) + "\n"
-                                yield json.dumps({"type": "tool_args", "content": tool_info["args"]}) + "\n"
-                                yield json.dumps({"type": "tool_content", "content": tool_info["content"]}) + "\n"
-                    
+                                yield {"type": "tool_name", "content": tool_info["name"]}
+                                yield {"type": "tool_args", "content": tool_info["args"]}
+                                yield {"type": "tool_content", "content": tool_info["content"]}
+                
+                    if node_name == "tools" and isinstance(output, dict):
+                        tool_iterations = output.get("tool_iterations", tool_iterations)
+                
+                    if node_name == "rerank" and isinstance(output, dict):
+                        reranked_docs = output.get("reranked_docs", [])
+                        degraded = output.get("degraded", degraded)
+                
                     # Get final answer from agent node output
                     if node_name == "agent" and isinstance(output, dict):
+                        llm_tokens += output.get("llm_tokens", 0)
+                        forced_answer = output.get("forced_answer", forced_answer)
                         new_messages = output.get("messages", [])
                         for msg in new_messages:
                             # Check if this is a final AI response (not a tool call)
@@ -332,23 +687,27 @@ Content: {content}
                                 has_tool_calls = hasattr(msg, "tool_calls") and msg.tool_calls
                                 if not has_tool_calls:
                                     full_answer = msg.content
-            
-            # Stream the final answer
-            if full_answer:
-                yield json.dumps({"type": "answer", "content": full_answer}) + "\n"
-            else:
-                logger.warning(f"No answer generated. sent_tool_indices: {sent_tool_indices}")
-                yield json.dumps({
-                    "type": "answer",
-                    "content": "Sorry, an error occurred while processing your request."
-                }) + "\n"
-                
-        except Exception as e:
-            logger.error(f"Error in Agent pipeline: {e}", exc_info=True)
-            yield json.dumps({
-                "type": "answer",
-                "content": f"Sorry, an error occurred: {str(e)}"
-            }) + "\n"
+        finally:
+            if initial_state["speculation"] is not None:
+                initial_state["speculation"].cancel()
+        
+        yield {
+            "type": "budget",
+            "content": {
+                "tool_iterations": tool_iterations,
+                "max_tool_iterations": settings.AGENT_MAX_TOOL_ITERATIONS,
+                "elapsed_seconds": round(time.monotonic() - started, 2),
+                "deadline_seconds": settings.AGENT_DEADLINE_SECONDS,
+                "llm_tokens": llm_tokens,
+                "forced_answer": forced_answer,
+                "degraded": degraded
+            }
+        }
+        if full_answer:
+            yield {"type": "reranked_docs", "content": reranked_docs}
+            yield {"type": "answer", "content": full_answer}
+        else:
+            logger.warning(f"No answer generated. sent_tool_indices: {sent_tool_indices}")
 
 
 # Singleton instance
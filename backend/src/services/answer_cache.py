@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.config import settings
+from src.services.qdrant_service import qdrant_service
+from src.utils.cache import LRUCache
+from src.utils.text import key_terms, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    Semantic cache of streamed answers for standalone questions.
+
+    Entries hold the question's dense embedding and the events that were
+    streamed for it. A lookup matches the normalized question exactly, or
+    the most similar stored question above ANSWER_CACHE_SIMILARITY_THRESHOLD
+    that names the same numbers and vehicle classes (questions about "xe
+    máy" and "ô tô" embed close together but have different fines).
+    Entries expire after ANSWER_CACHE_TTL_SECONDS, are evicted LRU, and are
+    all dropped when the corpus version changes: CORPUS_VERSION when set,
+    otherwise the version vectorDB/main.py records in the collection (or the
+    embedded index manifest), read at startup and every
+    CORPUS_VERSION_REFRESH_SECONDS.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self.entries = LRUCache(
+            max_items=settings.ANSWER_CACHE_MAX_ITEMS,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS
+        )
+        self.threshold = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        self.corpus_version = settings.CORPUS_VERSION
+        self._task: Optional[asyncio.Task] = None
+        self._initialized = True
+
+    def lookup(self, query: str, embedding: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find cached events for a question.
+
+        Args:
+            query: The user question
+            embedding: Dense embedding of the question
+
+        Returns:
+            The cached stream events, or None on a miss
+        """
+        key = normalize_query(query)
+        entry = self.entries.get(key)
+        if entry is not None:
+            logger.info(f"Answer cache exact hit for query: {query[:50]}")
+            return entry["events"]
+
+        candidates = self.entries.items()
+        if not candidates:
+            return None
+
+        matrix = np.stack([value["embedding"] for _, value in candidates])
+        similarities = matrix @ self._normalize(embedding)
+        terms = key_terms(query)
+        for best in np.argsort(-similarities):
+            if similarities[best] < self.threshold:
+                return None
+            best_key = candidates[best][0]
+            if key_terms(best_key) != terms:
+                logger.info(
+                    f"Answer cache: similar question (similarity {similarities[best]:.3f}) names other "
+                    f"numbers or vehicles, not reused: {query[:50]} -> {best_key[:50]}"
+                )
+                continue
+            entry = self.entries.get(best_key)
+            if entry is None:
+                continue
+            logger.info(
+                f"Answer cache semantic hit (similarity {similarities[best]:.3f}) "
+                f"for query: {query[:50]} -> {best_key[:50]}"
+            )
+            return entry["events"]
+        return None
+
+    def store(self, query: str, embedding: np.ndarray, events: List[Dict[str, Any]]) -> None:
+        """Cache the events streamed for a question."""
+        self.entries.put(normalize_query(query), {
+            "embedding": self._normalize(embedding),
+            "events": events
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.entries.stats()
+        stats["corpus_version"] = self.corpus_version
+        return stats
+
+    async def start(self) -> None:
+        """Read the corpus version, then keep re-reading it in the background (on app startup)."""
+        if settings.CORPUS_VERSION or self._task is not None:
+            return
+        await self.refresh_corpus_version()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh_corpus_version(self) -> None:
+        """Clear the cache if the ingested corpus changed since the last read."""
+        try:
+            version = await qdrant_service.corpus_version_async()
+        except Exception as e:
+            logger.warning(f"Could not read the corpus version, keeping {self.corpus_version}: {e}")
+            return
+        if version is None:
+            logger.warning("The collection records no corpus version, re-run vectorDB/main.py to add it")
+            return
+        if version != self.corpus_version:
+            logger.info(f"Corpus version changed {self.corpus_version} -> {version}, clearing answer cache")
+            self.entries.clear()
+            self.corpus_version = version
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.CORPUS_VERSION_REFRESH_SECONDS)
+            await self.refresh_corpus_version()
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Singleton instance
+answer_cache = AnswerCache()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+CROSS_ENCODER_MODEL = settings.CROSS_ENCODER_MODEL
+
+# The LLM reranker scores on a 0-10 rubric; cross-encoder probabilities are scaled to match
+SCORE_SCALE = 10.0
+
+
+class CrossEncoderService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        # The model is loaded on first use so the LLM backend never pays for torch/onnx
+        self.model = None
+        self._load_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cross-encoder")
+        self._initialized = True
+
+    def _load(self):
+        with self._load_lock:
+            if self.model is not None:
+                return self.model
+
+            from sentence_transformers import CrossEncoder
+
+            logger.info(
+                f"Loading cross-encoder {CROSS_ENCODER_MODEL} "
+                f"(backend={settings.CROSS_ENCODER_BACKEND}) on CPU..."
+            )
+            self.model = CrossEncoder(
+                CROSS_ENCODER_MODEL,
+                device="cpu",
+                max_length=settings.CROSS_ENCODER_MAX_LENGTH,
+                backend=settings.CROSS_ENCODER_BACKEND,
+            )
+            logger.info("Cross-encoder loaded successfully")
+            return self.model
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score (query, text) pairs with the cross-encoder.
+
+        Args:
+            query: The user query
+            texts: Candidate document texts
+
+        Returns:
+            One relevance score per text, on the same 0-10 scale as the LLM reranker
+        """
+        if not texts:
+            return []
+
+        model = self._load()
+        probabilities = model.predict(
+            [(query, text) for text in texts],
+            batch_size=settings.CROSS_ENCODER_BATCH_SIZE,
+            show_progress_bar=False,
+        )
+        return [float(p) * SCORE_SCALE for p in probabilities]
+
+    async def score_async(self, query: str, texts: List[str]) -> List[float]:
+        """Score pairs in the cross-encoder pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.score, query, texts)
+
+
+# Singleton instance
+cross_encoder_service = CrossEncoderService()
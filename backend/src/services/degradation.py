@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import settings
+from src.services.admission import admission
+
+logger = logging.getLogger(__name__)
+
+# Mildest first; each mode also keeps the savings of the ones before it
+DEGRADATION_MODES = ("full", "local_rerank", "rrf_only", "cache_only")
+LOCAL_RERANKER_BACKENDS = ("lexical", "cross_encoder")
+
+
+class DegradationController:
+    """
+    Steps the RAG pipeline down to cheaper modes under load, and back up.
+
+    - full: configured reranker (RERANKER_BACKEND)
+    - local_rerank: local reranker (DEGRADED_RERANKER_BACKEND), no rerank LLM calls
+    - rrf_only: no rerank, hybrid search order kept, DEGRADED_SEARCH_TOP_K results
+    - cache_only: only semantic answer cache hits are answered, other requests get a busy answer
+
+    Every DEGRADATION_INTERVAL_SECONDS the pressure is read from the
+    admission stages: the worst of queue fill, p95 queue wait against
+    DEGRADATION_MAX_WAIT_SECONDS and p95 call latency against the stage's
+    latency target, over the last DEGRADATION_WINDOW_SECONDS. Pressure held
+    at or above DEGRADATION_ESCALATE_PRESSURE for DEGRADATION_ESCALATE_SECONDS
+    moves one mode down; pressure held at or below DEGRADATION_RECOVER_PRESSURE
+    for DEGRADATION_RECOVER_SECONDS moves one mode up. Samples from before
+    the last change are ignored, so each mode is judged on its own load.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        if settings.DEGRADATION_MODE is not None and settings.DEGRADATION_MODE not in DEGRADATION_MODES:
+            raise ValueError(
+                f"Unknown DEGRADATION_MODE {settings.DEGRADATION_MODE!r}, expected one of {DEGRADATION_MODES}"
+            )
+        if settings.DEGRADED_RERANKER_BACKEND not in LOCAL_RERANKER_BACKENDS:
+            raise ValueError(
+                f"Unknown DEGRADED_RERANKER_BACKEND {settings.DEGRADED_RERANKER_BACKEND!r}, "
+                f"expected one of {LOCAL_RERANKER_BACKENDS}"
+            )
+
+        self.level = DEGRADATION_MODES.index(settings.DEGRADATION_MODE or "full")
+        self.changed_at = time.monotonic()
+        # Since when the pressure has been high / low without interruption
+        self._high_since: Optional[float] = None
+        self._low_since: Optional[float] = None
+        self.pressure = 0.0
+        self.pressure_source = ""
+        self.transitions = 0
+        self._task: Optional[asyncio.Task] = None
+        self._initialized = True
+
+    @property
+    def mode(self) -> str:
+        return DEGRADATION_MODES[self.level]
+
+    def rerank_backend(self) -> Optional[str]:
+        """Reranker backend for the current mode, None for RERANKER_BACKEND."""
+        if self.mode == "full":
+            return None
+        if self.mode == "local_rerank":
+            return settings.DEGRADED_RERANKER_BACKEND
+        return "rrf"
+
+    def search_top_k(self) -> int:
+        """Number of hybrid search results for the current mode."""
+        if self.level >= DEGRADATION_MODES.index("rrf_only"):
+            return min(settings.DEGRADED_SEARCH_TOP_K, settings.HYBRID_SEARCH_TOP_K)
+        return settings.HYBRID_SEARCH_TOP_K
+
+    def cache_only(self) -> bool:
+        return self.mode == "cache_only"
+
+    def start(self) -> None:
+        """Start evaluating in the background (on app startup)."""
+        if self._task is None and settings.DEGRADATION_ENABLED and settings.DEGRADATION_MODE is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def evaluate(self, now: Optional[float] = None) -> str:
+        """Read the pressure and move one mode down or up if it has held long enough."""
+        now = time.monotonic() if now is None else now
+        self.pressure, self.pressure_source = self._pressure(now)
+
+        if self.pressure >= settings.DEGRADATION_ESCALATE_PRESSURE:
+            self._low_since = None
+            self._high_since = self._high_since or now
+            if now - self._high_since >= settings.DEGRADATION_ESCALATE_SECONDS and self.level < len(DEGRADATION_MODES) - 1:
+                self._change(self.level + 1, now)
+        elif self.pressure <= settings.DEGRADATION_RECOVER_PRESSURE:
+            self._high_since = None
+            self._low_since = self._low_since or now
+            if now - self._low_since >= settings.DEGRADATION_RECOVER_SECONDS and self.level > 0:
+                self._change(self.level - 1, now)
+        else:
+            self._high_since = self._low_since = None
+        return self.mode
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "pinned": settings.DEGRADATION_MODE is not None,
+            "pressure": round(self.pressure, 3),
+            "pressure_source": self.pressure_source,
+            "seconds_in_mode": round(time.monotonic() - self.changed_at, 1),
+            "transitions": self.transitions,
+        }
+
+    def _pressure(self, now: float) -> Tuple[float, str]:
+        """Worst load ratio over the admission stages, and the stage signal it came from."""
+        since = max(now - settings.DEGRADATION_WINDOW_SECONDS, self.changed_at)
+        worst, source = 0.0, ""
+        for name, limiter in admission.stages.items():
+            load = limiter.recent(since)
+            signals = {
+                "queue": load["queue_fill"],
+                "wait": load["wait_p95"] / settings.DEGRADATION_MAX_WAIT_SECONDS,
+            }
+            target = settings.DEGRADATION_LATENCY_TARGETS_SECONDS.get(name)
+            if target:
+                signals["latency"] = load["hold_p95"] / target
+            for signal, value in signals.items():
+                if value > worst:
+                    worst, source = value, f"{name} {signal}"
+        return worst, source
+
+    def _change(self, level: int, now: float) -> None:
+        logger.warning(
+            f"Degradation mode {self.mode} -> {DEGRADATION_MODES[level]} "
+            f"(pressure {self.pressure:.2f} from {self.pressure_source or 'nothing'})"
+        )
+        self.level = level
+        self.changed_at = now
+        self._high_since = self._low_since = None
+        self.transitions += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.DEGRADATION_INTERVAL_SECONDS)
+            try:
+                self.evaluate()
+            except Exception as e:
+                logger.error(f"Degradation evaluation failed: {e}", exc_info=True)
+
+
+# Singleton instance
+degradation = DegradationController()
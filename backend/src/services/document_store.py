@@ -0,0 +1,78 @@
+import json
+import logging
+import mmap
+import os
+import uuid
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PointId = Union[str, int]
+
+
+def _canonical_id(point_id: PointId) -> str:
+    # Qdrant returns dashed UUIDs while ingestion writes hex ones
+    return str(uuid.UUID(str(point_id)))
+
+
+class DocumentStore:
+    """
+    Read-only, memory-mapped store of point payloads written by
+    `vectorDB/main.py --docstore-dir`.
+
+    Layout: payloads.bin holds the UTF-8 JSON payloads back to back,
+    offsets.npy the int64 start offset of each payload (plus the end),
+    and ids.json the point id of each row.
+
+    Args:
+        store_dir: Directory containing ids.json, offsets.npy and payloads.bin
+    """
+
+    def __init__(self, store_dir: str):
+        logger.info(f"Opening document store at {store_dir}...")
+        with open(os.path.join(store_dir, "ids.json"), "r", encoding="utf-8") as f:
+            self.rows = {_canonical_id(point_id): row for row, point_id in enumerate(json.load(f))}
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode="r")
+
+        self._file = open(os.path.join(store_dir, "payloads.bin"), "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        logger.info(f"Document store opened: {len(self.rows)} documents")
+
+    def __contains__(self, point_id: PointId) -> bool:
+        return _canonical_id(point_id) in self.rows
+
+    def get(self, point_id: PointId) -> Dict[str, Any]:
+        """Decode the payload of a point. Raises KeyError for unknown ids."""
+        row = self.rows[_canonical_id(point_id)]
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._data[start:end].decode("utf-8"))
+
+
+class LazyPayload(Mapping):
+    """Read-only payload that is decoded from the document store on first access."""
+
+    def __init__(self, store: DocumentStore, point_id: PointId):
+        self._store = store
+        self._point_id = point_id
+        self._payload = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._payload is None:
+            self._payload = self._store.get(self._point_id)
+        return self._payload
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._payload is not None else "not loaded"
+        return f"LazyPayload({self._point_id!r}, {state})"
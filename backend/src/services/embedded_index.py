@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Qdrant's reciprocal rank fusion constant: score = sum(1 / (rank + RRF_K)), rank starting at 0
+RRF_K = 2
+
+
+class EmbeddedIndex:
+    """
+    In-process exact hybrid search over the index exported by
+    `vectorDB/main.py --embedded-index-dir`.
+
+    Dense search is a dot product against the memory-mapped, L2-normalized
+    matrix. Sparse search scores BM25 term weights through an inverted index
+    with Qdrant's IDF modifier. Both lists are fused with RRF, as the
+    collection query does server-side.
+
+    Args:
+        index_dir: Directory containing dense.npy, sparse_*.npy, points.json and manifest.json
+    """
+
+    def __init__(self, index_dir: str):
+        logger.info(f"Loading embedded index from {index_dir}...")
+        self.dense = np.load(os.path.join(index_dir, "dense.npy"), mmap_mode="r")
+
+        with open(os.path.join(index_dir, "points.json"), "r", encoding="utf-8") as f:
+            points = json.load(f)
+        self.ids = [point["id"] for point in points]
+        self.payloads = [point["payload"] for point in points]
+        # Exports from before the corpus version was recorded have none
+        self.corpus_version = None
+        manifest_path = os.path.join(index_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.corpus_version = json.load(f).get("corpus_version")
+        # Payload field -> value per row, built on first filter use
+        self._field_values: Dict[str, np.ndarray] = {}
+
+        indptr = np.load(os.path.join(index_dir, "sparse_indptr.npy"))
+        indices = np.load(os.path.join(index_dir, "sparse_indices.npy"))
+        values = np.load(os.path.join(index_dir, "sparse_values.npy"))
+        self._build_inverted_index(indptr, indices, values)
+
+        logger.info(f"Embedded index loaded: {len(self.ids)} points, {len(self.terms)} sparse terms")
+
+    def _build_inverted_index(self, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray) -> None:
+        """Convert the doc-major CSR export into term-major postings with IDF."""
+        n_docs = len(indptr) - 1
+        doc_ids = np.repeat(np.arange(n_docs), np.diff(indptr))
+
+        order = np.argsort(indices, kind="stable")
+        self.postings_docs = doc_ids[order]
+        self.postings_values = values[order].astype(np.float32)
+
+        self.terms, starts, counts = np.unique(indices[order], return_index=True, return_counts=True)
+        self.term_starts = starts
+        self.term_ends = starts + counts
+
+        # Same IDF as the collection's sparse vector modifier
+        self.idf = np.log((n_docs - counts + 0.5) / (counts + 0.5) + 1.0).astype(np.float32)
+
+    def _filter_rows(self, filters: Optional[Dict[str, str]]) -> Optional[np.ndarray]:
+        """Rows whose payload matches every filter value exactly, or None without filters."""
+        if not filters:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, value in filters.items():
+            if field not in self._field_values:
+                self._field_values[field] = np.array([payload.get(field) for payload in self.payloads], dtype=object)
+            mask &= self._field_values[field] == value
+        return np.flatnonzero(mask)
+
+    def _dense_scores(self, dense_vector: np.ndarray) -> np.ndarray:
+        query = np.asarray(dense_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self.dense @ query
+
+    def _sparse_scores(self, sparse_vector) -> np.ndarray:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        positions = np.searchsorted(self.terms, sparse_vector.indices)
+        for position, term, weight in zip(positions, sparse_vector.indices, sparse_vector.values):
+            if position >= len(self.terms) or self.terms[position] != term:
+                continue
+            start, end = self.term_starts[position], self.term_ends[position]
+            # A term appears at most once per document, so the fancy-indexed add has no collisions
+            scores[self.postings_docs[start:end]] += weight * self.idf[position] * self.postings_values[start:end]
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, limit: int, candidates: np.ndarray = None) -> np.ndarray:
+        """Indices of the `limit` best scores, best first."""
+        if candidates is None:
+            candidates = np.arange(len(scores))
+        limit = min(limit, len(candidates))
+        if limit == 0:
+            return candidates[:0]
+        subset = scores[candidates]
+        top = np.argpartition(-subset, limit - 1)[:limit]
+        return candidates[top[np.argsort(-subset[top], kind="stable")]]
+
+    def search(
+        self, dense_vector: np.ndarray, sparse_vector, limit: int, filters: Optional[Dict[str, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Hybrid search with local RRF fusion.
+
+        Args:
+            dense_vector: Dense query embedding
+            sparse_vector: Sparse query embedding (indices, values)
+            limit: Number of results per branch and in the fused list
+            filters: Exact payload values both branches are restricted to
+
+        Returns:
+            Result dicts with id, score and payload, like QdrantService.hybrid_search
+        """
+        rows = self._filter_rows(filters)
+        dense_top = self._top(self._dense_scores(dense_vector), limit, rows)
+
+        sparse_scores = self._sparse_scores(sparse_vector)
+        # Like a sparse vector search, only documents sharing a term with the query match
+        sparse_rows = np.flatnonzero(sparse_scores > 0)
+        if rows is not None:
+            sparse_rows = np.intersect1d(sparse_rows, rows)
+        sparse_top = self._top(sparse_scores, limit, sparse_rows)
+
+        fused: Dict[int, float] = {}
+        for ranking in (dense_top, sparse_top):
+            for rank, row in enumerate(ranking):
+                fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rank + RRF_K)
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {"id": self.ids[row], "score": score, "payload": self.payloads[row]}
+            for row, score in best
+        ]
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from fastembed.sparse.sparse_embedding_base import SparseEmbedding
+
+from src.utils.cache import LRUCache
+from src.utils.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# The disk tier is swept on startup and after this many writes by the process
+DISK_SWEEP_EVERY_WRITES = 256
+
+
+def _embedding_nbytes(value: Tuple[np.ndarray, SparseEmbedding]) -> int:
+    dense, sparse = value
+    return dense.nbytes + sparse.indices.nbytes + sparse.values.nbytes
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of (dense, sparse) query embeddings.
+
+    The memory tier is an LRU bounded by entry count and bytes. The optional
+    disk tier stores one .npz file per query in a directory that several
+    workers can share; writes are atomic so readers never see partial files.
+    A file's mtime is its last use (hits touch it). Sweeps delete files
+    unused for disk_ttl_seconds, then the least recently used ones until
+    the directory is within disk_max_bytes.
+
+    Args:
+        model_key: Identifies the embedding models; part of every key
+        max_items: Maximum number of in-memory entries
+        max_bytes: Maximum in-memory size of the cached vectors
+        disk_dir: Directory for the shared disk tier, or None to disable it
+        disk_max_bytes: Maximum size of the disk tier files, or None for no limit
+        disk_ttl_seconds: Disk tier files unused for longer are deleted, or None to keep them
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        max_items: int,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None,
+        disk_ttl_seconds: Optional[float] = None
+    ):
+        self.model_key = model_key
+        self.memory = LRUCache(max_items=max_items, max_bytes=max_bytes, sizeof=_embedding_nbytes)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        # Embedding pool threads write concurrently; one of them sweeps at a time
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Embedding disk cache enabled at {self.disk_dir}")
+            self.sweep_disk()
+
+    def key(self, query: str) -> str:
+        """Cache key for a query: normalized text, scoped to the embedding models."""
+        return f"{self.model_key}\x00{normalize_query(query)}"
+
+    def get_memory(self, key: str) -> Optional[Tuple[np.ndarray, SparseEmbedding]]:
+        """Look up the memory tier only (safe to call on the event loop)."""
+        return self.memory.get(key)
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, SparseEmbedding]]:
+        """Look up memory, then disk."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        return self.get_disk(key)
+
+    def get_disk(self, key: str) -> Optional[Tuple[np.ndarray, SparseEmbedding]]:
+        """Look up the disk tier only; hits are promoted to memory."""
+        if self.disk_dir is None:
+            return None
+
+        value = self._read_disk(key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: Tuple[np.ndarray, SparseEmbedding]) -> None:
+        dense, sparse = value
+        # Cached arrays are shared between requests, so make them read-only
+        for array in (dense, sparse.indices, sparse.values):
+            array.flags.writeable = False
+        self.memory.put(key, value)
+        if self.disk_dir is not None:
+            self._write_disk(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_evictions"] = self.disk_evictions
+        return stats
+
+    def sweep_disk(self) -> None:
+        """Delete expired disk tier files, then the least recently used ones over disk_max_bytes."""
+        if self.disk_dir is None or (self.disk_max_bytes is None and self.disk_ttl_seconds is None):
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for path in self.disk_dir.glob("*.npz"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+
+            now = time.time()
+            total = sum(size for _, size, _ in files)
+            evicted = 0
+            for mtime, size, path in files:
+                expired = self.disk_ttl_seconds is not None and now - mtime > self.disk_ttl_seconds
+                over = self.disk_max_bytes is not None and total > self.disk_max_bytes
+                if not expired and not over:
+                    break
+                try:
+                    path.unlink()
+                    evicted += 1
+                except FileNotFoundError:
+                    # Another worker swept it first
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not delete embedding cache file {path}: {e}")
+                    continue
+                total -= size
+
+            if evicted:
+                self.disk_evictions += evicted
+                logger.info(f"Embedding disk cache sweep: {evicted} files deleted, {total / (1024 * 1024):.1f} MB kept")
+        finally:
+            self._sweep_lock.release()
+
+    def _disk_path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.disk_dir / f"{digest}.npz"
+
+    def _read_disk(self, key: str) -> Optional[Tuple[np.ndarray, SparseEmbedding]]:
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                dense = data["dense"]
+                sparse = SparseEmbedding(values=data["sparse_values"], indices=data["sparse_indices"])
+            # Mark as recently used for the sweep
+            os.utime(path)
+            return dense, sparse
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache file {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, value: Tuple[np.ndarray, SparseEmbedding]) -> None:
+        dense, sparse = value
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, dense=dense, sparse_indices=sparse.indices, sparse_values=sparse.values)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache file {path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+
+        with self._writes_lock:
+            self._writes += 1
+            sweep = self._writes % DISK_SWEEP_EVERY_WRITES == 0
+        if sweep:
+            self.sweep_disk()
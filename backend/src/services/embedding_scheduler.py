@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching scheduler for query embeddings.
+
+    Queries that arrive within `window_ms` of the first pending one (or until
+    `max_batch_size` queries are pending) are embedded together with one call
+    to `embed_batch` in `executor`. Each caller awaits its own future.
+
+    Args:
+        embed_batch: Blocking function mapping (keys, queries) to embeddings, in order
+        executor: Executor that runs `embed_batch`
+        window_ms: How long to wait for more queries after the first one
+        max_batch_size: Flush as soon as this many queries are pending
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str], List[str]], List[Tuple[Any, Any]]],
+        executor: Executor,
+        window_ms: float,
+        max_batch_size: int,
+    ):
+        self.embed_batch = embed_batch
+        self.executor = executor
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches; the event loop only keeps weak references to tasks
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.queries = 0
+
+    async def embed(self, key: str, query: str) -> Tuple[Any, Any]:
+        """Queue a query for the next batch and wait for its (dense, sparse) embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, query, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "pending": len(self._pending),
+            "running": len(self._running),
+        }
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        # Identical queries in the same window are embedded once
+        unique = {}
+        for key, query, _ in batch:
+            unique.setdefault(key, query)
+        keys = list(unique)
+
+        self.batches += 1
+        self.queries += len(batch)
+
+        try:
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(
+                self.executor, self.embed_batch, keys, [unique[key] for key in keys]
+            )
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(keys)} queries failed: {e}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_key = dict(zip(keys, embeddings))
+        for key, _, future in batch:
+            # Callers that gave up (cancelled) no longer want a result
+            if not future.done():
+                future.set_result(by_key[key])
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from openai import AsyncOpenAI
+
+from src.config import settings
+from src.services.rate_limiter import rate_limiter
+from src.services.session_store import session_store
+from src.utils.context_builder import FALLBACK_CHARS_PER_TOKEN, count_tokens
+from src.utils.prompt_manager import prompt_manager
+
+logger = logging.getLogger(__name__)
+
+# Each turn sent to the summarizer is cut to this many tokens (answers quote whole clauses)
+SUMMARY_TURN_MAX_TOKENS = 400
+SUMMARY_MESSAGE_PREFIX = "Tóm tắt các lượt hội thoại trước đó:\n"
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN] + " [...]"
+
+
+def _turn_tokens(turn: Dict[str, str]) -> int:
+    return count_tokens(turn.get("query", "")) + count_tokens(turn.get("response", ""))
+
+
+def _digest(turns: List[Dict[str, str]]) -> str:
+    """Hash of a run of turns, to tell whether a cached summary belongs to this conversation."""
+    digest = hashlib.sha256()
+    for turn in turns:
+        digest.update(turn.get("query", "").encode("utf-8") + b"\0")
+        digest.update(turn.get("response", "").encode("utf-8") + b"\0")
+    return digest.hexdigest()[:16]
+
+
+class HistoryManager:
+    """
+    Bounded chat history for the agent prompt.
+
+    Only the last HISTORY_RECENT_TURNS turns that fit in HISTORY_MAX_TOKENS
+    are replayed verbatim; older turns are folded into a running summary,
+    kept in the session and sent as one system message. Summaries are
+    refreshed in the background (after each answer and whenever a request
+    finds them behind), so a request never waits for one: turns not yet
+    folded in are left out until the refresh lands. History only carries the user questions and final
+    answers, so tool calls and retrieved documents of earlier turns never
+    reach the prompt.
+
+    Turns are numbered from the start of the conversation, counting the
+    ones the session trimmed away (its offset), so a summary keeps matching
+    once the session is at SESSION_MAX_TURNS. A summary records the number
+    of turns it covers and a hash of the last one; it is only reused when
+    that turn is still the same, so a client that starts a new conversation
+    under the same id starts a new summary.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # session_id -> running refresh task (also keeps the task referenced)
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.counters = {"refreshes": 0, "failures": 0}
+        self._initialized = True
+
+    def build_messages(
+        self,
+        chat_history: Optional[List[Dict[str, str]]],
+        session_id: Optional[str] = None,
+        summary_entry: Optional[Dict[str, Any]] = None,
+        offset: int = 0,
+        user_id: Optional[str] = None
+    ) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        Messages for the chat history: an optional summary system message,
+        then the recent turns as Human/AI pairs.
+
+        Args:
+            chat_history: Previous turns as {"query", "response"}, oldest first
+            session_id: Session holding the running summary; without it older turns are dropped
+            summary_entry: The session's summary {"summary", "upto", "digest"}, if any
+            offset: Turns of the conversation before chat_history (trimmed from the session)
+            user_id: User charged for the tokens of a summary refresh
+
+        Returns:
+            The messages and a summary {"turns", "recent", "summarized", "dropped", "tokens"}
+        """
+        turns = chat_history or []
+        older, recent = self._split(turns)
+
+        summary, folded = self._cached_summary(session_id, older, summary_entry, offset)
+        if folded < len(older):
+            self._schedule_refresh(session_id, older, summary, folded, offset, user_id)
+
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=SUMMARY_MESSAGE_PREFIX + summary))
+        for turn in recent:
+            messages.append(HumanMessage(content=turn.get("query", "")))
+            messages.append(AIMessage(content=turn.get("response", "")))
+
+        info = {
+            "turns": len(turns),
+            "recent": len(recent),
+            "summarized": folded,
+            "dropped": len(older) - folded,
+            "tokens": sum(count_tokens(message.content) for message in messages),
+        }
+        if turns:
+            logger.info(
+                f"History for session {session_id}: {info['recent']}/{info['turns']} turns verbatim, "
+                f"{info['summarized']} summarized, {info['dropped']} left out, {info['tokens']} tokens"
+            )
+        return messages, info
+
+    def record_turn(
+        self,
+        chat_history: Optional[List[Dict[str, str]]],
+        query: str,
+        answer: str,
+        session_id: Optional[str] = None,
+        summary_entry: Optional[Dict[str, Any]] = None,
+        offset: int = 0,
+        user_id: Optional[str] = None
+    ) -> None:
+        """
+        Start folding the turns that the next request will no longer replay,
+        so their summary is ready by the time the user asks again (and
+        before the session trims them).
+        """
+        turns = list(chat_history or []) + [{"query": query, "response": answer}]
+        older, _ = self._split(turns)
+        summary, folded = self._cached_summary(session_id, older, summary_entry, offset)
+        if folded < len(older):
+            self._schedule_refresh(session_id, older, summary, folded, offset, user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "refreshing": len(self._refreshing)}
+
+    def _split(self, turns: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """Split turns into (older, recent): recent is the newest turns within the count and token limits."""
+        # The latest turn is always kept, with its answer cut down if it is over budget on its own
+        budget = settings.HISTORY_MAX_TOKENS
+        start = len(turns)
+        for i in range(len(turns) - 1, -1, -1):
+            if len(turns) - i > settings.HISTORY_RECENT_TURNS:
+                break
+            cost = _turn_tokens(turns[i])
+            if cost > budget and i != len(turns) - 1:
+                break
+            budget -= cost
+            start = i
+
+        recent = turns[start:]
+        if recent and budget < 0:
+            latest = recent[-1]
+            response_budget = max(settings.HISTORY_MAX_TOKENS - count_tokens(latest.get("query", "")), 0)
+            recent = recent[:-1] + [{**latest, "response": _clip(latest.get("response", ""), response_budget)}]
+        return turns[:start], recent
+
+    @staticmethod
+    def _cached_summary(
+        session_id: Optional[str],
+        older: List[Dict[str, str]],
+        entry: Optional[Dict[str, Any]],
+        offset: int = 0
+    ) -> Tuple[str, int]:
+        """The stored summary if it belongs to this conversation, and the number of these older turns it covers."""
+        if not session_id or not settings.HISTORY_SUMMARY_ENABLED or not entry or "upto" not in entry:
+            return "", 0
+        # Older turns it covers; none when it ends among the trimmed turns
+        covered = entry["upto"] - offset
+        if covered > len(older):
+            return "", 0
+        if covered > 0 and entry["digest"] != _digest(older[covered - 1:covered]):
+            return "", 0
+        return entry["summary"], max(covered, 0)
+
+    def _schedule_refresh(
+        self,
+        session_id: Optional[str],
+        older: List[Dict[str, str]],
+        summary: str,
+        folded: int,
+        offset: int,
+        user_id: Optional[str] = None
+    ) -> None:
+        if not session_id or not settings.HISTORY_SUMMARY_ENABLED or session_id in self._refreshing:
+            return
+        self._refreshing[session_id] = asyncio.create_task(
+            self._refresh(session_id, older, summary, folded, offset, user_id)
+        )
+
+    async def _refresh(
+        self,
+        session_id: str,
+        older: List[Dict[str, str]],
+        summary: str,
+        folded: int,
+        offset: int,
+        user_id: Optional[str] = None
+    ) -> None:
+        try:
+            new_summary = await self._summarize(summary, older[folded:], user_id)
+            upto = offset + len(older)
+            await session_store.update(
+                session_id,
+                summary={"summary": new_summary, "upto": upto, "digest": _digest(older[-1:])}
+            )
+            self.counters["refreshes"] += 1
+            logger.info(f"History summary for session {session_id} now covers {upto} turns")
+        except Exception as e:
+            self.counters["failures"] += 1
+            logger.warning(f"History summary refresh failed for session {session_id}: {e}")
+        finally:
+            self._refreshing.pop(session_id, None)
+
+    async def _summarize(self, summary: str, turns: List[Dict[str, str]], user_id: Optional[str] = None) -> str:
+        system_prompt = prompt_manager.render(
+            "history_summary_system_prompt.jinja2",
+            max_words=settings.HISTORY_SUMMARY_MAX_WORDS
+        )
+        user_prompt = prompt_manager.render(
+            "history_summary_user_prompt.jinja2",
+            summary=summary,
+            turns=[
+                {
+                    "query": _clip(turn.get("query", ""), SUMMARY_TURN_MAX_TOKENS),
+                    "response": _clip(turn.get("response", ""), SUMMARY_TURN_MAX_TOKENS),
+                }
+                for turn in turns
+            ]
+        )
+        response = await self.client.chat.completions.create(
+            model=settings.HISTORY_SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0
+        )
+        if user_id and response.usage is not None:
+            await rate_limiter.charge_llm_tokens(user_id, response.usage.total_tokens)
+        return (response.choices[0].message.content or "").strip()
+
+
+# Singleton instance
+history_manager = HistoryManager()
@@ -1,14 +1,24 @@
 import os
-# Limit ONNX Runtime threads to prevent excessive RAM usage
-os.environ["OMP_NUM_THREADS"] = "1" 
-os.environ["ONNXRUNTIME_INTRA_OP_NUM_THREADS"] = "1"
+from src.config import settings
+# Limit ONNX Runtime threads to prevent excessive RAM usage (EMBEDDING_THREADS, 1 by default)
+os.environ["OMP_NUM_THREADS"] = str(settings.EMBEDDING_THREADS)
+os.environ["ONNXRUNTIME_INTRA_OP_NUM_THREADS"] = str(settings.EMBEDDING_THREADS)
+import asyncio
+import itertools
 import logging
-from typing import List, Dict, Any
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
-from qdrant_client import QdrantClient, models
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
 from fastembed import TextEmbedding, SparseTextEmbedding
-from src.config import settings
+from src.services.admission import admission
+from src.services.document_store import DocumentStore, LazyPayload
+from src.services.embedded_index import EmbeddedIndex
+from src.services.embedding_cache import EmbeddingCache
+from src.services.embedding_scheduler import EmbeddingBatcher
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +29,18 @@ QDRANT_API_KEY = settings.QDRANT_API_KEY
 COLLECTION_NAME = "traffic_law_qa_system"
 DENSE_MODEL_NAME = settings.DENSE_MODEL_NAME
 SPARSE_MODEL_NAME = settings.SPARSE_MODEL_NAME
+SEARCH_BACKENDS = ("qdrant", "embedded")
+DENSE_QUANTIZATIONS = ("none", "scalar", "binary")
+# Vectorless point written by vectorDB/main.py whose payload holds the corpus version
+CORPUS_VERSION_POINT_ID = uuid.uuid5(uuid.uuid5(uuid.NAMESPACE_URL, COLLECTION_NAME), "corpus_version").hex
+# Payload fields with keyword indexes that searches can filter on
+FILTER_FIELDS = ("year", "article")
+GRPC_CHANNEL_OPTIONS = {
+    # Give every pooled channel its own connection instead of sharing the global subchannel pool
+    "grpc.use_local_subchannel_pool": 1,
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_permit_without_calls": 1,
+}
 
 
 
@@ -35,40 +57,222 @@ class QdrantService:
         if self._initialized:
             return
             
+        if settings.SEARCH_BACKEND not in SEARCH_BACKENDS:
+            raise ValueError(
+                f"Unknown SEARCH_BACKEND {settings.SEARCH_BACKEND!r}, expected one of {SEARCH_BACKENDS}"
+            )
+        
+        if settings.DENSE_QUANTIZATION not in DENSE_QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown DENSE_QUANTIZATION {settings.DENSE_QUANTIZATION!r}, expected one of {DENSE_QUANTIZATIONS}"
+            )
+        
+        # Quantized collections search the compressed vectors first, then rescore
+        # an oversampled candidate list with the original vectors
+        self.dense_search_params = None
+        if settings.DENSE_QUANTIZATION != "none":
+            self.dense_search_params = models.SearchParams(
+                quantization=models.QuantizationSearchParams(
+                    rescore=settings.DENSE_QUANTIZATION_RESCORE,
+                    oversampling=settings.DENSE_QUANTIZATION_OVERSAMPLING
+                )
+            )
+        
+        # SEARCH_BACKEND=embedded searches an in-process copy of the collection instead of Qdrant
+        self.embedded_index = None
+        if settings.SEARCH_BACKEND == "embedded":
+            self.embedded_index = EmbeddedIndex(settings.EMBEDDED_INDEX_DIR)
+        
+        # With a local document store, Qdrant returns ids and scores only and
+        # payloads are read from the memory-mapped store when first accessed
+        self.document_store = None
+        if settings.DOCUMENT_STORE_DIR:
+            self.document_store = DocumentStore(settings.DOCUMENT_STORE_DIR)
+        self.with_payload = self.document_store is None
+        
         logger.info(f"Connecting to Qdrant at {QDRANT_URL}...")
         self.client = QdrantClient(
             url=QDRANT_URL,
             api_key=QDRANT_API_KEY
         )
+        # With QDRANT_PREFER_GRPC the async clients talk gRPC; each client owns one channel,
+        # so a small pool of clients (used round-robin) spreads requests over several connections
+        pool_size = settings.QDRANT_GRPC_POOL_SIZE if settings.QDRANT_PREFER_GRPC else 1
+        self.async_clients = [
+            AsyncQdrantClient(
+                url=QDRANT_URL,
+                api_key=QDRANT_API_KEY,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                grpc_options=GRPC_CHANNEL_OPTIONS if settings.QDRANT_PREFER_GRPC else None
+            )
+            for _ in range(pool_size)
+        ]
+        self._async_client_pool = itertools.cycle(self.async_clients)
+        
+        # Embedding is CPU-bound, so async callers run it in a dedicated pool.
+        # The "embedding" admission stage bounds how many queries may wait on that pool at once.
+        self.embed_executor = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_MAX_WORKERS,
+            thread_name_prefix="embedding"
+        )
         
         # Initialize embedding models
         logger.info("Loading embedding models...")
-        self.dense_model = TextEmbedding(DENSE_MODEL_NAME)
-        self.sparse_model = SparseTextEmbedding(SPARSE_MODEL_NAME)
+        self.dense_model = TextEmbedding(DENSE_MODEL_NAME, threads=settings.EMBEDDING_THREADS)
+        self.sparse_model = SparseTextEmbedding(SPARSE_MODEL_NAME, threads=settings.EMBEDDING_THREADS)
         logger.info("Embedding models loaded successfully")
         
+        dense_key = DENSE_MODEL_NAME
+        if settings.DENSE_VECTOR_DIM:
+            dense_key = f"{DENSE_MODEL_NAME}@{settings.DENSE_VECTOR_DIM}"
+        self.embedding_cache = EmbeddingCache(
+            model_key=f"{dense_key}|{SPARSE_MODEL_NAME}",
+            max_items=settings.EMBEDDING_CACHE_MAX_ITEMS,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            disk_dir=settings.EMBEDDING_CACHE_DIR,
+            disk_max_bytes=(
+                settings.EMBEDDING_CACHE_DISK_MAX_MB * 1024 * 1024
+                if settings.EMBEDDING_CACHE_DISK_MAX_MB is not None else None
+            ),
+            disk_ttl_seconds=settings.EMBEDDING_CACHE_DISK_TTL_SECONDS
+        )
+        
+        # Concurrent queries arriving within a short window are embedded as one ONNX batch
+        self.embedding_batcher = None
+        if settings.EMBEDDING_BATCH_WINDOW_MS > 0:
+            self.embedding_batcher = EmbeddingBatcher(
+                self._embed_batch_uncached,
+                self.embed_executor,
+                window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
+            )
+        
         self._initialized = True
     
-    def hybrid_search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
-        """
-        Perform hybrid search combining dense and sparse vectors with RRF fusion.
+    def _async_client(self) -> AsyncQdrantClient:
+        """Next client from the async client pool."""
+        return next(self._async_client_pool)
+    
+    async def corpus_version_async(self) -> Optional[str]:
+        """Version of the ingested corpus, None if the collection or index does not record one."""
+        if self.embedded_index is not None:
+            return self.embedded_index.corpus_version
+        records = await self._async_client().retrieve(
+            COLLECTION_NAME, ids=[CORPUS_VERSION_POINT_ID], with_payload=True
+        )
+        return records[0].payload.get("corpus_version") if records else None
+    
+    @staticmethod
+    def _truncate_dense(dense_vector: np.ndarray) -> np.ndarray:
+        """Matryoshka truncation to DENSE_VECTOR_DIM, renormalized like the ingested vectors."""
+        dim = settings.DENSE_VECTOR_DIM
+        if not dim or dim >= len(dense_vector):
+            return dense_vector
+        truncated = dense_vector[:dim]
+        norm = np.linalg.norm(truncated)
+        return truncated / norm if norm else truncated
+    
+    def embed_query(self, query: str) -> Tuple[Any, Any]:
+        """Compute the (dense, sparse) query embeddings, using the embedding cache."""
+        key = self.embedding_cache.key(query)
+        cached = self.embedding_cache.get_memory(key)
+        if cached is not None:
+            return cached
+        return self._embed_uncached(key, query)
+    
+    async def embed_query_async(self, query: str) -> Tuple[Any, Any]:
+        """Compute the query embeddings in the embedding pool without blocking the event loop."""
+        # Memory hits skip the pool entirely; disk lookups happen inside it
+        key = self.embedding_cache.key(query)
+        cached = self.embedding_cache.get_memory(key)
+        if cached is not None:
+            return cached
         
-        Args:
-            query: The search query
-            limit: Number of results to return
-            
-        Returns:
-            List of search results with payload and scores
-        """
-        # Generate embeddings for the query
-        dense_vector = list(self.dense_model.query_embed(query))[0]
+        async with admission.stage("embedding").slot():
+            if self.embedding_batcher is not None:
+                return await self.embedding_batcher.embed(key, query)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.embed_executor, self._embed_uncached, key, query)
+    
+    def _embed_uncached(self, key: str, query: str) -> Tuple[Any, Any]:
+        """Embed after a memory-tier miss: try the disk tier, then run the models."""
+        cached = self.embedding_cache.get_disk(key)
+        if cached is not None:
+            return cached
+        
+        dense_vector = self._truncate_dense(list(self.dense_model.query_embed(query))[0])
         sparse_vector = list(self.sparse_model.query_embed(query))[0]
+        self.embedding_cache.put(key, (dense_vector, sparse_vector))
+        return dense_vector, sparse_vector
+    
+    async def embed_queries_async(self, queries: List[str]) -> List[Tuple[Any, Any]]:
+        """Embed several queries, running all cache misses as one batch in the embedding pool."""
+        keys = [self.embedding_cache.key(query) for query in queries]
+        embeddings = [self.embedding_cache.get_memory(key) for key in keys]
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            async with admission.stage("embedding").slot():
+                if self.embedding_batcher is not None:
+                    computed = await asyncio.gather(*[
+                        self.embedding_batcher.embed(keys[i], queries[i]) for i in missing
+                    ])
+                else:
+                    loop = asyncio.get_running_loop()
+                    computed = await loop.run_in_executor(
+                        self.embed_executor,
+                        self._embed_batch_uncached,
+                        [keys[i] for i in missing],
+                        [queries[i] for i in missing]
+                    )
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+        
+        return embeddings
+    
+    def _embed_batch_uncached(self, keys: List[str], queries: List[str]) -> List[Tuple[Any, Any]]:
+        """Batch version of `_embed_uncached`: one model call per model for all disk-tier misses."""
+        embeddings = [self.embedding_cache.get_disk(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            texts = [queries[i] for i in missing]
+            dense_vectors = [self._truncate_dense(vector) for vector in self.dense_model.query_embed(texts)]
+            sparse_vectors = list(self.sparse_model.query_embed(texts))
+            for i, dense_vector, sparse_vector in zip(missing, dense_vectors, sparse_vectors):
+                embeddings[i] = (dense_vector, sparse_vector)
+                self.embedding_cache.put(keys[i], embeddings[i])
+        return embeddings
+    
+    @staticmethod
+    def _build_filter(filters: Optional[Dict[str, str]]) -> Optional[models.Filter]:
+        """Qdrant filter matching every given payload field exactly."""
+        if not filters:
+            return None
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter fields {sorted(unknown)}, expected some of {FILTER_FIELDS}")
+        return models.Filter(must=[
+            models.FieldCondition(key=field, match=models.MatchValue(value=value))
+            for field, value in filters.items()
+        ])
+    
+    def _build_prefetch(self, dense_vector, sparse_vector, limit: int, filters: Optional[Dict[str, str]] = None) -> List[models.Prefetch]:
+        """
+        Build the dense + sparse prefetch branches. The query itself fuses them
+        with RRF, so result scores are the RRF sums and show how much the two
+        branches agree (a single fusion level, like the embedded index).
+        """
+        # Filters go into both branches so each one fills its `limit` with matching points
+        query_filter = self._build_filter(filters)
         
-        # Stage 1: Parallel prefetch (dense + sparse)
-        hybrid_query = [
+        # Parallel prefetch (dense + sparse), fused by the RRF query of the caller
+        return [
             models.Prefetch(
                 query=dense_vector.tolist(),
                 using="dense",
+                filter=query_filter,
+                params=self.dense_search_params,
                 limit=limit
             ),
             models.Prefetch(
@@ -77,36 +281,179 @@ class QdrantService:
                     values=sparse_vector.values.tolist()
                 ),
                 using="sparse",
+                filter=query_filter,
                 limit=limit
             ),
         ]
+    
+    def _to_results(self, response) -> List[Dict[str, Any]]:
+        """
+        Convert a Qdrant query response into plain result dicts.
         
-        # Stage 2: Fusion with RRF
-        fusion_query = models.Prefetch(
-            prefetch=hybrid_query,
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=limit,
-        )
-        
-        # Execute the query
-        response = self.client.query_points(
-            collection_name=COLLECTION_NAME,
-            prefetch=fusion_query,
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=limit,
-            with_payload=True,
-        )
-        
+        Without payloads in the response, each payload is a LazyPayload over
+        the document store. Points missing from the store get payload None
+        and are filled in by `_fill_missing_payloads`.
+        """
         results = []
         for point in response.points:
+            payload = point.payload
+            if self.document_store is not None and payload is None and point.id in self.document_store:
+                payload = LazyPayload(self.document_store, point.id)
             results.append({
                 "id": point.id,
                 "score": point.score,
-                "payload": point.payload
+                "payload": payload
             })
+        return results
+    
+    @staticmethod
+    def _missing_payload_ids(results: List[Dict[str, Any]]) -> List[Any]:
+        return [result["id"] for result in results if result["payload"] is None]
+    
+    @staticmethod
+    def _set_payloads(results: List[Dict[str, Any]], records) -> None:
+        payloads = {record.id: record.payload for record in records}
+        for result in results:
+            if result["payload"] is None:
+                result["payload"] = payloads.get(result["id"]) or {}
+    
+    def _fill_missing_payloads(self, results: List[Dict[str, Any]]) -> None:
+        """Fetch payloads of points the document store does not know (store older than the collection)."""
+        missing = self._missing_payload_ids(results)
+        if missing:
+            logger.warning(f"{len(missing)} points missing from the document store, fetching their payloads")
+            self._set_payloads(results, self.client.retrieve(COLLECTION_NAME, ids=missing, with_payload=True))
+    
+    async def _fill_missing_payloads_async(self, results: List[Dict[str, Any]]) -> None:
+        """Async version of `_fill_missing_payloads`."""
+        missing = self._missing_payload_ids(results)
+        if missing:
+            logger.warning(f"{len(missing)} points missing from the document store, fetching their payloads")
+            async with admission.stage("qdrant").slot():
+                records = await self._async_client().retrieve(COLLECTION_NAME, ids=missing, with_payload=True)
+            self._set_payloads(results, records)
+    
+    def hybrid_search(self, query: str, limit: int = 100, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Perform hybrid search combining dense and sparse vectors with RRF fusion.
+        
+        Blocking version, kept for scripts and sync callers. Request handlers
+        should use `hybrid_search_async`.
+        
+        Args:
+            query: The search query
+            limit: Number of results to return
+            filters: Exact payload values to restrict the search to, e.g. {"year": "2024"}
+            
+        Returns:
+            List of search results with payload and scores
+        """
+        # Generate embeddings for the query
+        dense_vector, sparse_vector = self.embed_query(query)
+        
+        if self.embedded_index is not None:
+            results = self.embedded_index.search(dense_vector, sparse_vector, limit, filters)
+        else:
+            # Execute the query
+            response = self.client.query_points(
+                collection_name=COLLECTION_NAME,
+                prefetch=self._build_prefetch(dense_vector, sparse_vector, limit, filters),
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=limit,
+                with_payload=self.with_payload,
+            )
+            results = self._to_results(response)
+            self._fill_missing_payloads(results)
         
         logger.info(f"Hybrid search returned {len(results)} results for query limit {limit}")
         return results
+    
+    async def hybrid_search_async(
+        self, query: str, limit: int = 100, filters: Optional[Dict[str, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Async hybrid search: embedding runs in the embedding pool and the
+        Qdrant call goes through `AsyncQdrantClient`.
+        
+        Args:
+            query: The search query
+            limit: Number of results to return
+            filters: Exact payload values to restrict the search to, e.g. {"year": "2024"}
+            
+        Returns:
+            List of search results with payload and scores
+        """
+        dense_vector, sparse_vector = await self.embed_query_async(query)
+        
+        if self.embedded_index is not None:
+            # Exact search over ~1k points takes well under a millisecond, so it runs inline
+            results = self.embedded_index.search(dense_vector, sparse_vector, limit, filters)
+            logger.info(f"Embedded hybrid search returned {len(results)} results for query limit {limit}")
+            return results
+        
+        async with admission.stage("qdrant").slot():
+            response = await self._async_client().query_points(
+                collection_name=COLLECTION_NAME,
+                prefetch=self._build_prefetch(dense_vector, sparse_vector, limit, filters),
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=limit,
+                with_payload=self.with_payload,
+            )
+        
+        results = self._to_results(response)
+        await self._fill_missing_payloads_async(results)
+        logger.info(f"Hybrid search returned {len(results)} results for query limit {limit}")
+        return results
+
+    
+    async def hybrid_search_batch_async(
+        self, queries: List[str], limit: int = 100, filters: Optional[List[Optional[Dict[str, str]]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Run several hybrid searches with batched embedding and a single
+        `query_batch_points` round trip.
+        
+        Args:
+            queries: The search queries
+            limit: Number of results to return per query
+            filters: Optional payload filters per query, as for `hybrid_search_async`
+            
+        Returns:
+            One result list per query, in the same order
+        """
+        if not queries:
+            return []
+        
+        if filters is None:
+            filters = [None] * len(queries)
+        embeddings = await self.embed_queries_async(queries)
+        
+        if self.embedded_index is not None:
+            return [
+                self.embedded_index.search(dense_vector, sparse_vector, limit, query_filters)
+                for (dense_vector, sparse_vector), query_filters in zip(embeddings, filters)
+            ]
+        
+        requests = [
+            models.QueryRequest(
+                prefetch=self._build_prefetch(dense_vector, sparse_vector, limit, query_filters),
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=limit,
+                with_payload=self.with_payload,
+            )
+            for (dense_vector, sparse_vector), query_filters in zip(embeddings, filters)
+        ]
+        
+        async with admission.stage("qdrant").slot():
+            responses = await self._async_client().query_batch_points(
+                collection_name=COLLECTION_NAME,
+                requests=requests,
+            )
+        
+        results = [self._to_results(response) for response in responses]
+        await self._fill_missing_payloads_async([result for query_results in results for result in query_results])
+        logger.info(f"Batched hybrid search returned {[len(r) for r in results]} results for {len(queries)} queries")
+        return results
 
 
 # Singleton instance
@@ -0,0 +1,166 @@
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from src.config import settings
+from src.utils.cache import LRUCache
+from src.utils.limiter import Overloaded
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKENDS = ("memory", "redis")
+REDIS_KEY_PREFIX = "traffic-law-qa:bucket:"
+
+# Refill, then take `amount` if there is enough (or always, with debt), atomically on the server clock.
+# KEYS[1] = bucket; ARGV = rate per second, capacity, amount, debt flag ("1" / "0")
+_REDIS_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if ARGV[4] == "1" or tokens >= amount then
+    tokens = tokens - amount
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil((capacity - tokens) / rate) + 60)
+return {allowed, tostring(tokens)}
+"""
+
+
+class InMemoryBucketBackend:
+    """Token buckets in a process-local LRU; each worker limits on its own."""
+
+    def __init__(self, max_items: int):
+        # key -> (tokens, monotonic time of the last update)
+        self.buckets = LRUCache(max_items=max_items)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float, debt: bool = False) -> Tuple[bool, float]:
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(key) or (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = debt or tokens >= amount
+            if allowed:
+                tokens -= amount
+            self.buckets.put(key, (tokens, now))
+            return allowed, tokens
+
+
+class RedisBucketBackend:
+    """Token buckets in Redis, shared by all workers (one Lua call per take)."""
+
+    def __init__(self, url: str):
+        # Optional dependency, only needed with RATE_LIMIT_BACKEND=redis
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float, debt: bool = False) -> Tuple[bool, float]:
+        allowed, tokens = await self.script(
+            keys=[REDIS_KEY_PREFIX + key],
+            args=[rate, capacity, amount, "1" if debt else "0"]
+        )
+        return bool(int(allowed)), float(tokens)
+
+
+class UserRateLimiter:
+    """
+    Per-user token buckets, so one user cannot use up the shared capacity.
+
+    Each user_id has two buckets:
+    - requests: USER_REQUESTS_PER_MINUTE, bursts of USER_REQUEST_BURST.
+      Every chat request takes one token.
+    - LLM tokens: USER_LLM_TOKENS_PER_MINUTE, bursts of USER_LLM_TOKEN_BURST.
+      Usage is only known once a call ends, so requests are admitted while
+      the bucket is positive and each agent, rerank and history summary
+      LLM call is charged when it ends (agent calls also when cut off), to
+      the user whose request started the run, possibly into debt that the
+      user then waits out.
+
+    A refused request raises Overloaded (429) with the seconds until the
+    bucket allows it again. Buckets live in the worker (RATE_LIMIT_BACKEND
+    "memory") or in Redis ("redis") to hold across workers.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        if settings.RATE_LIMIT_BACKEND not in RATE_LIMIT_BACKENDS:
+            raise ValueError(
+                f"Unknown RATE_LIMIT_BACKEND {settings.RATE_LIMIT_BACKEND!r}, expected one of {RATE_LIMIT_BACKENDS}"
+            )
+        if settings.RATE_LIMIT_BACKEND == "redis":
+            self.backend = RedisBucketBackend(settings.RATE_LIMIT_REDIS_URL)
+        else:
+            self.backend = InMemoryBucketBackend(settings.RATE_LIMIT_MAX_USERS)
+        self.counters = {"allowed": 0, "rejected_requests": 0, "rejected_llm_tokens": 0, "llm_tokens_charged": 0}
+        self._initialized = True
+
+    def weight(self, user_id: str) -> float:
+        """Fair-queuing weight of a user."""
+        return settings.USER_WEIGHTS.get(user_id, 1.0)
+
+    async def admit(self, user_id: str) -> None:
+        """Take a request token for the user, or raise Overloaded (429)."""
+        if not settings.USER_RATE_LIMIT_ENABLED:
+            return
+
+        llm_rate = settings.USER_LLM_TOKENS_PER_MINUTE / 60
+        _, llm_tokens = await self.backend.take(
+            f"llm:{user_id}", llm_rate, settings.USER_LLM_TOKEN_BURST, 0
+        )
+        if llm_tokens <= 0:
+            self.counters["rejected_llm_tokens"] += 1
+            raise Overloaded(
+                f"user {user_id}", 429, self._wait_seconds(1 - llm_tokens, llm_rate), "LLM token limit reached"
+            )
+
+        request_rate = settings.USER_REQUESTS_PER_MINUTE / 60
+        allowed, tokens = await self.backend.take(
+            f"requests:{user_id}", request_rate, settings.USER_REQUEST_BURST, 1
+        )
+        if not allowed:
+            self.counters["rejected_requests"] += 1
+            raise Overloaded(
+                f"user {user_id}", 429, self._wait_seconds(1 - tokens, request_rate), "request limit reached"
+            )
+        self.counters["allowed"] += 1
+
+    async def charge_llm_tokens(self, user_id: str, tokens: int) -> None:
+        """Charge the LLM tokens of one LLM call."""
+        if not settings.USER_RATE_LIMIT_ENABLED or tokens <= 0:
+            return
+        await self.backend.take(
+            f"llm:{user_id}", settings.USER_LLM_TOKENS_PER_MINUTE / 60, settings.USER_LLM_TOKEN_BURST, tokens, debt=True
+        )
+        self.counters["llm_tokens_charged"] += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": settings.RATE_LIMIT_BACKEND, **self.counters}
+
+    @staticmethod
+    def _wait_seconds(missing: float, rate: float) -> int:
+        return max(1, math.ceil(missing / rate))
+
+
+# Singleton instance
+rate_limiter = UserRateLimiter()
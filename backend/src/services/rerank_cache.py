@@ -0,0 +1,70 @@
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.cache import LRUCache
+from src.utils.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class RerankScoreCache:
+    """
+    Cache of rerank scores per (query, document) pair.
+
+    Keys combine a hash of the normalized query, the point id, the reranker
+    model and a hash of the prompt templates, so changing any of them misses.
+    Point ids are derived from the clause text at ingestion, so edited
+    clauses get new ids and never reuse stale scores.
+
+    Pointwise scorers (the cross-encoder) score each document on its own.
+    LLM scores are relative to the candidate list (e.g. the rubric favours
+    the most recent decree in the list), so their keys also carry a hash of
+    the whole candidate set and only score the same list again, plus the
+    prompt parameters (context token budget and shard count) that decide
+    how much of each document the LLM saw and which documents it compared.
+
+    Args:
+        max_items: Maximum number of cached scores
+        ttl_seconds: Scores older than this are treated as missing
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: Optional[float] = None):
+        self.scores = LRUCache(max_items=max_items, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def keys(
+        query: str,
+        documents: List[Dict[str, Any]],
+        model: str,
+        template_hash: str,
+        listwise: bool = False,
+        prompt_params: str = ""
+    ) -> List[Optional[Tuple]]:
+        """
+        One key per document; None for documents without an id, which are never cached.
+
+        With `listwise`, keys are scoped to the candidate set: a document's
+        score is only reused for the same set of documents and `prompt_params`.
+        """
+        query_hash = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()[:16]
+        set_hash = ""
+        if listwise:
+            ids = sorted(str(doc.get("id")) for doc in documents)
+            set_hash = hashlib.sha256("\0".join(ids).encode("utf-8")).hexdigest()[:16]
+        return [
+            (query_hash, str(doc["id"]), model, template_hash, set_hash, prompt_params)
+            if doc.get("id") is not None else None
+            for doc in documents
+        ]
+
+    def get_many(self, keys: List[Optional[Tuple]]) -> List[Optional[float]]:
+        return [self.scores.get(key) if key is not None else None for key in keys]
+
+    def put_many(self, keys: List[Optional[Tuple]], scores: List[Optional[float]]) -> None:
+        for key, score in zip(keys, scores):
+            if key is not None and score is not None:
+                self.scores.put(key, score)
+
+    def stats(self) -> Dict[str, int]:
+        return self.scores.stats()
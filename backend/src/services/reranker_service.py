@@ -1,13 +1,27 @@
+import asyncio
 import logging
 import json
-from typing import List, Dict, Any, Union, Tuple
+import time
+from typing import List, Dict, Any, Optional, Union, Tuple
 from openai import AsyncOpenAI
 from src.config import settings
+from src.services.admission import admission
+from src.services.cross_encoder_service import cross_encoder_service
+from src.services.rate_limiter import rate_limiter
+from src.services.rerank_cache import RerankScoreCache
+from src.utils.context_builder import build_context
 from src.utils.prompt_manager import prompt_manager
+from src.utils.text import lexical_scores
 
 logger = logging.getLogger(__name__)
 
 RERANKER_MODEL = settings.RERANKER_MODEL
+# "lexical" and "rrf" (keep the hybrid search order) are the cheap backends of the degraded modes
+RERANKER_BACKENDS = ("llm", "cross_encoder", "cascade", "lexical", "rrf")
+CASCADE_STAGE1_SCORERS = ("lexical", "cross_encoder")
+RERANKER_TEMPLATES = ("reranker_system_prompt.jinja2", "reranker_user_prompt.jinja2")
+# The reranker prompt's rubric scores from 0 to 10
+LLM_SCORE_MAX = 10.0
 
 
 class RerankerService:
@@ -23,76 +37,111 @@ class RerankerService:
         if self._initialized:
             return
             
-        logger.info(f"Initializing reranker with model: {RERANKER_MODEL}...")
+        if settings.RERANKER_BACKEND not in RERANKER_BACKENDS:
+            raise ValueError(
+                f"Unknown RERANKER_BACKEND {settings.RERANKER_BACKEND!r}, expected one of {RERANKER_BACKENDS}"
+            )
+        self.backend = settings.RERANKER_BACKEND
+        if settings.CASCADE_STAGE1_SCORER not in CASCADE_STAGE1_SCORERS:
+            raise ValueError(
+                f"Unknown CASCADE_STAGE1_SCORER {settings.CASCADE_STAGE1_SCORER!r}, "
+                f"expected one of {CASCADE_STAGE1_SCORERS}"
+            )
+        
+        logger.info(f"Initializing reranker with backend: {self.backend}, model: {self.model_name}...")
         self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.score_cache = None
+        if settings.RERANK_CACHE_ENABLED:
+            self.score_cache = RerankScoreCache(
+                max_items=settings.RERANK_CACHE_MAX_ITEMS,
+                ttl_seconds=settings.RERANK_CACHE_TTL_SECONDS
+            )
+        self.llm_template_hash = prompt_manager.template_hash(*RERANKER_TEMPLATES)
+        
+        # Per-stage counters of the cascade backend
+        self.cascade_counters = {
+            "requests": 0,
+            "stage2_calls": 0,
+            "stage2_skipped": 0,
+            "stage2_errors": 0,
+            "stage1_documents": 0,
+            "stage2_documents": 0,
+            "stage1_seconds": 0.0,
+            "stage2_seconds": 0.0,
+        }
         self._initialized = True
     
+    @property
+    def model_name(self) -> str:
+        """Name of the model behind the active backend."""
+        return self.model_for(self.backend)
+    
+    @staticmethod
+    def model_for(backend: str) -> str:
+        """Name of the model behind a backend."""
+        if backend in ("lexical", "rrf"):
+            return backend
+        if backend == "cross_encoder":
+            return settings.CROSS_ENCODER_MODEL
+        if backend == "cascade":
+            stage1 = settings.CROSS_ENCODER_MODEL if settings.CASCADE_STAGE1_SCORER == "cross_encoder" else "lexical"
+            return f"{stage1} -> {RERANKER_MODEL}"
+        return RERANKER_MODEL
+    
+    def cascade_stats(self) -> Dict[str, Any]:
+        """Cascade counters plus how often the LLM stage was skipped."""
+        counters = dict(self.cascade_counters)
+        requests = counters["requests"]
+        counters["stage2_skip_rate"] = counters["stage2_skipped"] / requests if requests else 0.0
+        return counters
+    
     async def rerank(
         self, 
         query: str, 
         documents: List[Dict[str, Any]], 
         top_k: int = settings.RERANK_TOP_K,
-        return_reasoning: bool = False
+        return_reasoning: bool = False,
+        backend: Optional[str] = None,
+        shards: Optional[int] = None,
+        user_id: Optional[str] = None
     ) -> Union[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], str]]:
         """
-        Rerank documents using the LLM model with advanced legal reasoning.
+        Rerank documents with the configured backend.
+        
+        Args:
+            query: The user query
+            documents: Hybrid search results
+            top_k: Number of documents to keep
+            return_reasoning: Also return the reranker's reasoning text
+            backend: Override RERANKER_BACKEND for this call (one of RERANKER_BACKENDS)
+            shards: Override RERANK_LLM_SHARDS for this call's LLM scoring
+            user_id: User charged for the tokens of the rerank LLM calls
         """
         if not documents:
             if return_reasoning:
                 return [], ""
             return []
         
-        # Prepare documents for the prompt
-        docs_content = ""
-        for i, doc in enumerate(documents):
-            payload = doc.get("payload", {})
-            content = payload.get("content", "")
-            title = payload.get("title", "")
-            year = payload.get("year", "N/A")  # Ensure year is passed explicitly
-            
-            # Formatting document block
-            docs_content += (
-                f"--- Document ID {i} ---\n"
-                f"Year: {year}\n"
-                f"Title: {title}\n"
-                f"Content: {content}\n\n"
-            )
-
-        system_prompt = prompt_manager.render("reranker_system_prompt.jinja2")
-
-        user_prompt = prompt_manager.render(
-            "reranker_user_prompt.jinja2",
-            query=query,
-            docs_content=docs_content
-        )
-
+        backend = backend or self.backend
+        if backend == "rrf":
+            if return_reasoning:
+                return self._keep_order(documents, top_k), "Search order kept, reranking skipped"
+            return self._keep_order(documents, top_k)
+        
         try:
-            response = await self.client.chat.completions.create(
-                model=RERANKER_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
-            )
+            if backend == "lexical":
+                scores, reasoning = self._score_lexical(query, documents), "Lexical overlap scores"
+            elif backend == "cascade":
+                scores, reasoning = await self._score_cascade(query, documents, top_k, shards, user_id)
+            else:
+                scores, reasoning = await self._score_cached(backend, query, documents, shards, user_id)
             
-            content = response.choices[0].message.content
-            scores_map = json.loads(content)
-            reasoning = scores_map.get("reason", "")
-            
-            # Combine scores with documents
+            # Combine scores with documents; documents of dropped shards (and the
+            # cascade's tail behind the LLM-scored head) have no score
             scored_docs = []
-            for i, doc in enumerate(documents):
-                # Handle keys: "0", 0, or "id_0"
-                score = scores_map.get(str(i))
-                if score is None:
-                    score = scores_map.get(i)
-                if score is None:
-                    score = scores_map.get(f"id_{i}", 0.0)
-                
+            for doc, score in zip(documents, scores):
                 doc_with_score = doc.copy()
-                doc_with_score["rerank_score"] = float(score)
+                doc_with_score["rerank_score"] = score if score is not None else 0.0
                 scored_docs.append(doc_with_score)
             
             # Sort by score descending
@@ -103,18 +152,273 @@ class RerankerService:
             return scored_docs[:top_k]
             
         except Exception as e:
-            logger.error(f"Error during LLM reranking: {e}")
+            logger.error(f"Error during {backend} reranking: {e}")
             # Fallback: return original top_k documents with dummy score
             logger.info("Falling back to original order due to error.")
-            fallback_docs = []
-            for doc in documents[:top_k]:
-                d = doc.copy()
-                d["rerank_score"] = 0.0
-                fallback_docs.append(d)
+            fallback_docs = self._keep_order(documents, top_k)
+            for d in fallback_docs:
+                d["rerank_fallback"] = True
             
             if return_reasoning:
                 return fallback_docs, f"Error during reranking: {str(e)}"
             return fallback_docs
+    
+    @staticmethod
+    def _keep_order(documents: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """The first top_k documents in search (RRF) order, with a dummy score."""
+        kept_docs = []
+        for doc in documents[:top_k]:
+            d = doc.copy()
+            d["rerank_score"] = 0.0
+            kept_docs.append(d)
+        return kept_docs
+    
+    @staticmethod
+    def _score_lexical(query: str, documents: List[Dict[str, Any]]) -> List[float]:
+        """Query term overlap, on the 0-10 scale of the LLM scores."""
+        texts = [doc.get("payload", {}).get("content", "") for doc in documents]
+        return [score * LLM_SCORE_MAX for score in lexical_scores(query, texts)]
+    
+    async def _score_cached(
+        self,
+        backend: str,
+        query: str,
+        documents: List[Dict[str, Any]],
+        shards: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> Tuple[List[Optional[float]], str]:
+        """
+        Score with the "llm" or "cross_encoder" backend, reusing cached scores and caching new ones.
+        
+        Cross-encoder scores are pointwise, so only the misses are scored.
+        LLM scores depend on the whole candidate list: they are cached per
+        candidate set, and any miss rescores the full list.
+        """
+        listwise = backend == "llm"
+        keys = None
+        scores = [None] * len(documents)
+        if self.score_cache is not None:
+            template_hash = self.llm_template_hash if listwise else ""
+            prompt_params = ""
+            if listwise:
+                prompt_params = (
+                    f"context={settings.RERANK_CONTEXT_MAX_TOKENS}|shards={self._shard_count(shards, len(documents))}"
+                )
+            keys = self.score_cache.keys(
+                query,
+                documents,
+                f"{backend}:{self.model_for(backend)}",
+                template_hash,
+                listwise=listwise,
+                prompt_params=prompt_params
+            )
+            scores = self.score_cache.get_many(keys)
+        
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if listwise and missing:
+            # Never merge LLM scores from different candidate lists
+            missing = list(range(len(documents)))
+        reasoning = ""
+        if missing:
+            missing_docs = [documents[i] for i in missing]
+            if backend == "cross_encoder":
+                fresh_scores = await self._score_cross_encoder(query, missing_docs)
+            else:
+                fresh_scores, reasoning = await self._score_llm(query, missing_docs, shards, user_id)
+            for i, score in zip(missing, fresh_scores):
+                scores[i] = score
+            if keys is not None:
+                self.score_cache.put_many([keys[i] for i in missing], fresh_scores)
+        logger.info(f"Rerank scores: {len(documents) - len(missing)} cached, {len(missing)} scored by {backend}")
+        return scores, reasoning
+    
+    async def _score_cascade(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_k: int,
+        shards: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> Tuple[List[Optional[float]], str]:
+        """
+        Two-stage rerank. Stage 1 scores every candidate locally (lexical
+        overlap or the cross-encoder). If its top_k is clearly separated
+        from the rest and the best score is high enough, those scores are
+        final. Otherwise the stage-1 head of CASCADE_LLM_TOP_M documents is
+        rescored by the LLM and the tail gets no score, so it ranks last.
+        If the LLM stage fails, the stage-1 scores are used.
+        """
+        counters = self.cascade_counters
+        counters["requests"] += 1
+        counters["stage1_documents"] += len(documents)
+        
+        start = time.perf_counter()
+        if settings.CASCADE_STAGE1_SCORER == "cross_encoder":
+            stage1_scores, _ = await self._score_cached("cross_encoder", query, documents)
+        else:
+            stage1_scores = self._score_lexical(query, documents)
+        counters["stage1_seconds"] += time.perf_counter() - start
+        
+        order = sorted(range(len(documents)), key=lambda i: stage1_scores[i], reverse=True)
+        ranked = [stage1_scores[i] for i in order]
+        best = ranked[0]
+        gap = ranked[top_k - 1] - ranked[top_k] if len(ranked) > top_k else best
+        if best >= settings.CASCADE_MIN_TOP_SCORE and gap >= settings.CASCADE_CONFIDENCE_GAP:
+            counters["stage2_skipped"] += 1
+            logger.info(f"Cascade rerank: stage 1 confident (best {best:.2f}, top-{top_k} gap {gap:.2f}), LLM skipped")
+            return stage1_scores, f"Stage 1 ({settings.CASCADE_STAGE1_SCORER}) confident, LLM stage skipped"
+        
+        head = order[:max(settings.CASCADE_LLM_TOP_M, top_k)]
+        counters["stage2_calls"] += 1
+        counters["stage2_documents"] += len(head)
+        logger.info(
+            f"Cascade rerank: stage 1 uncertain (best {best:.2f}, top-{top_k} gap {gap:.2f}), "
+            f"sending {len(head)}/{len(documents)} documents to the LLM"
+        )
+        
+        start = time.perf_counter()
+        try:
+            head_scores, reasoning = await self._score_cached(
+                "llm", query, [documents[i] for i in head], shards, user_id
+            )
+        except Exception as e:
+            counters["stage2_errors"] += 1
+            logger.warning(f"Cascade LLM stage failed, using stage 1 scores: {e}")
+            return stage1_scores, f"LLM stage failed, stage 1 ({settings.CASCADE_STAGE1_SCORER}) scores used"
+        finally:
+            counters["stage2_seconds"] += time.perf_counter() - start
+        
+        scores = [None] * len(documents)
+        for i, score in zip(head, head_scores):
+            scores[i] = score
+        return scores, reasoning
+    
+    async def _score_cross_encoder(self, query: str, documents: List[Dict[str, Any]]) -> List[float]:
+        """Score documents locally with the cross-encoder."""
+        texts = [doc.get("payload", {}).get("content", "") for doc in documents]
+        async with admission.stage("rerank").slot():
+            return await cross_encoder_service.score_async(query, texts)
+    
+    async def _score_llm(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        shards: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> Tuple[List[Optional[float]], str]:
+        """Score documents with the LLM, in concurrent shards when `shards` (default RERANK_LLM_SHARDS) > 1."""
+        shards = self._shard_count(shards, len(documents))
+        if shards <= 1:
+            return await self._score_llm_shard(query, documents, user_id)
+        return await self._score_llm_sharded(query, documents, shards, user_id)
+    
+    @staticmethod
+    def _shard_count(shards: Optional[int], n_documents: int) -> int:
+        """Number of LLM prompts the documents are split into."""
+        return min(shards or settings.RERANK_LLM_SHARDS, n_documents)
+    
+    async def _score_llm_sharded(
+        self, query: str, documents: List[Dict[str, Any]], shards: int, user_id: Optional[str] = None
+    ) -> Tuple[List[Optional[float]], str]:
+        """
+        Split the documents round-robin into `shards` prompts scored concurrently.
+        
+        Round-robin keeps every shard a mix of high and low search ranks. The
+        rubric scores are absolute (0-10), so shard scores are clamped to that
+        range and merged as they are. Shards that fail or miss
+        RERANK_LLM_SHARD_TIMEOUT_SECONDS are dropped: their documents get no
+        score (None, ranked as 0.0 and never cached) and keep their search
+        order behind the scored ones.
+        """
+        assignments = [list(range(shard, len(documents), shards)) for shard in range(shards)]
+        tasks = [
+            asyncio.create_task(self._score_llm_shard(query, [documents[i] for i in indices], user_id))
+            for indices in assignments
+        ]
+        
+        start = time.perf_counter()
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=settings.RERANK_LLM_SHARD_TIMEOUT_SECONDS or None)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        scores = [None] * len(documents)
+        reasons = []
+        completed = 0
+        for shard, (indices, task) in enumerate(zip(assignments, tasks)):
+            if task in pending:
+                logger.warning(f"Rerank shard {shard} dropped after {settings.RERANK_LLM_SHARD_TIMEOUT_SECONDS}s deadline")
+                continue
+            if task.exception() is not None:
+                logger.warning(f"Rerank shard {shard} failed: {task.exception()}")
+                continue
+            shard_scores, reasoning = task.result()
+            for i, score in zip(indices, shard_scores):
+                scores[i] = score
+            if reasoning:
+                reasons.append(f"[Shard {shard}] {reasoning}")
+            completed += 1
+        
+        if not completed:
+            raise RuntimeError(f"All {shards} rerank shards failed or timed out")
+        
+        logger.info(
+            f"Sharded rerank: {completed}/{shards} shards of ~{len(assignments[0])} documents "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return scores, "\n".join(reasons)
+    
+    async def _score_llm_shard(
+        self, query: str, documents: List[Dict[str, Any]], user_id: Optional[str] = None
+    ) -> Tuple[List[float], str]:
+        """Score documents with the LLM model using advanced legal reasoning, charging the tokens to `user_id`."""
+        # Compact, token-budgeted encoding of the documents for the prompt
+        docs_content = build_context(
+            query, documents, settings.RERANK_CONTEXT_MAX_TOKENS, label="Document ID"
+        )["text"]
+
+        system_prompt = prompt_manager.render("reranker_system_prompt.jinja2")
+
+        user_prompt = prompt_manager.render(
+            "reranker_user_prompt.jinja2",
+            query=query,
+            docs_content=docs_content
+        )
+
+        # The "rerank" admission stage bounds concurrent completions across requests (one per shard)
+        async with admission.stage("rerank").slot():
+            response = await self.client.chat.completions.create(
+                model=RERANKER_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0,
+                response_format={"type": "json_object"}
+            )
+        if user_id and response.usage is not None:
+            await rate_limiter.charge_llm_tokens(user_id, response.usage.total_tokens)
+        
+        content = response.choices[0].message.content
+        scores_map = json.loads(content)
+        reasoning = scores_map.get("reason", "")
+        
+        scores = []
+        for i in range(len(documents)):
+            # Handle keys: "0", 0, or "id_0"
+            score = scores_map.get(str(i))
+            if score is None:
+                score = scores_map.get(i)
+            if score is None:
+                score = scores_map.get(f"id_{i}", 0.0)
+            try:
+                score = float(score)
+            except (TypeError, ValueError):
+                score = 0.0
+            scores.append(min(max(score, 0.0), LLM_SCORE_MAX))
+        
+        return scores, reasoning
 
 # Singleton instance
-reranker_service = RerankerService()
\ No newline at end of file
+reranker_service = RerankerService()
@@ -0,0 +1,170 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+from src.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKENDS = ("memory", "redis")
+REDIS_KEY_PREFIX = "traffic-law-qa:session:"
+
+
+def _empty_session() -> Dict[str, Any]:
+    # summary: running summary of the older turns, see HistoryManager
+    # offset: turns trimmed from the front (turns[0] is turn number `offset` of the conversation)
+    return {"turns": [], "offset": 0, "summary": None, "reranked_docs": []}
+
+
+def _plain_docs(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Payloads may be lazy mappings over the document store
+    return [
+        {
+            "id": str(doc.get("id")),
+            "score": doc.get("score"),
+            "rerank_score": doc.get("rerank_score"),
+            "payload": dict(doc.get("payload", {})),
+        }
+        for doc in documents
+    ]
+
+
+class InMemorySessionBackend:
+    """Sessions in a process-local LRU with TTL; each worker has its own."""
+
+    def __init__(self, max_items: int, ttl_seconds: Optional[float] = None):
+        self.sessions = LRUCache(max_items=max_items, ttl_seconds=ttl_seconds)
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.sessions.get(session_id)
+
+    async def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        self.sessions.put(session_id, session)
+
+    async def delete(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return self.sessions.stats()
+
+
+class RedisSessionBackend:
+    """Sessions as JSON in Redis, shared by all workers, expiring after the TTL."""
+
+    def __init__(self, url: str, ttl_seconds: Optional[int] = None):
+        # Optional dependency, only needed with SESSION_BACKEND=redis
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        value = await self.client.get(REDIS_KEY_PREFIX + session_id)
+        return json.loads(value) if value is not None else None
+
+    async def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        await self.client.set(
+            REDIS_KEY_PREFIX + session_id,
+            json.dumps(session, ensure_ascii=False),
+            ex=self.ttl_seconds
+        )
+
+    async def delete(self, session_id: str) -> None:
+        await self.client.delete(REDIS_KEY_PREFIX + session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class SessionStore:
+    """
+    Server-side conversation state, keyed by session id (the user_id when
+    the client sends none).
+
+    A session holds the turns ({"query", "response"}, oldest first, at most
+    SESSION_MAX_TURNS, with the number of older turns trimmed away as
+    `offset`), the running summary of the older turns and the
+    documents reranked for the last answer, so clients only need to send the
+    new query. The backend is chosen by SESSION_BACKEND: "memory" (LRU with
+    TTL, per worker) or "redis" (shared by workers, needs the redis package).
+
+    Sessions are never mutated in place: every write stores a new dict, so a
+    session loaded by one request is not changed under it by another.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        if settings.SESSION_BACKEND not in SESSION_BACKENDS:
+            raise ValueError(
+                f"Unknown SESSION_BACKEND {settings.SESSION_BACKEND!r}, expected one of {SESSION_BACKENDS}"
+            )
+        if settings.SESSION_BACKEND == "redis":
+            self.backend = RedisSessionBackend(settings.SESSION_REDIS_URL, settings.SESSION_TTL_SECONDS)
+        else:
+            self.backend = InMemorySessionBackend(settings.SESSION_MAX_ITEMS, settings.SESSION_TTL_SECONDS)
+        logger.info(f"Session store backend: {settings.SESSION_BACKEND}")
+        self._initialized = True
+
+    async def load(self, session_id: Optional[str]) -> Dict[str, Any]:
+        """The stored session, or an empty one."""
+        session = _empty_session()
+        if session_id:
+            session.update(await self.backend.get(session_id) or {})
+        return session
+
+    async def update(self, session_id: Optional[str], **fields: Any) -> None:
+        """Replace some fields of a session, creating it if needed."""
+        if not session_id:
+            return
+        session = await self.load(session_id)
+        session.update(fields)
+        await self.backend.put(session_id, session)
+
+    async def save_turn(
+        self,
+        session_id: Optional[str],
+        chat_history: List[Dict[str, str]],
+        query: str,
+        answer: str,
+        reranked_docs: Optional[List[Dict[str, Any]]] = None,
+        offset: int = 0
+    ) -> None:
+        """
+        Store a finished turn after the history it answered.
+
+        Args:
+            session_id: Session to write
+            chat_history: The history used for this turn (sent by the client or loaded from the session)
+            query: The user question
+            answer: The final answer
+            reranked_docs: Documents the answer was based on, empty if the agent did not search
+            offset: Turns trimmed before chat_history (the session's offset, 0 for a client history)
+        """
+        turns = list(chat_history) + [{"query": query, "response": answer}]
+        trimmed = max(len(turns) - settings.SESSION_MAX_TURNS, 0)
+        await self.update(
+            session_id,
+            turns=turns[trimmed:],
+            offset=offset + trimmed,
+            reranked_docs=_plain_docs(reranked_docs or [])
+        )
+
+    async def delete(self, session_id: str) -> None:
+        await self.backend.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": settings.SESSION_BACKEND, **self.backend.stats()}
+
+
+# Singleton instance
+session_store = SessionStore()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One running pipeline and everything it has produced so far."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.subscribers = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # Set (and replaced) whenever events are added or the flight ends
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent streams into one producer.
+
+    The first subscriber for a key starts the producer in its own task;
+    later subscribers for the same key attach to it. Every subscriber gets
+    all events from the start: the ones already produced are replayed, then
+    new ones as they arrive. The producer is not tied to any one client: it
+    keeps running while at least one subscriber is left and is cancelled
+    when the last one goes away. Finished flights are forgotten, so only
+    requests that overlap in time share work.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.counters = {"started": 0, "coalesced": 0, "cancelled": 0}
+        self._initialized = True
+
+    async def subscribe(
+        self,
+        key: Hashable,
+        producer: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Stream the events of the flight for `key`, starting it with `producer()` if none is running.
+
+        Errors raised by the producer are re-raised to every subscriber.
+        Close the generator (e.g. with contextlib.aclosing) when leaving
+        early, so the flight knows the subscriber is gone.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, producer))
+            self._flights[key] = flight
+            self.counters["started"] += 1
+        else:
+            self.counters["coalesced"] += 1
+            logger.info(f"Joined in-flight request ({flight.subscribers} already waiting, {len(flight.events)} events so far)")
+        flight.subscribers += 1
+
+        position = 0
+        try:
+            while True:
+                while position < len(flight.events):
+                    yield flight.events[position]
+                    position += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                self.counters["cancelled"] += 1
+                logger.info("All subscribers left, cancelling in-flight request")
+                # Forget it before it finishes cancelling, so new requests start a fresh run
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "in_flight": len(self._flights)}
+
+    async def _run(self, key: Hashable, flight: _Flight, producer: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            async for event in producer():
+                flight.events.append(event)
+                flight.notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+
+# Singleton instance
+single_flight = SingleFlight()
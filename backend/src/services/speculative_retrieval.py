@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+from src.services.degradation import degradation
+from src.services.qdrant_service import qdrant_service
+from src.services.reranker_service import reranker_service
+from src.utils.candidates import select_candidates
+from src.utils.text import token_jaccard
+
+logger = logging.getLogger(__name__)
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    # Speculative work may never be awaited; retrieve errors so they are not reported as unhandled
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Speculative retrieval failed: {task.exception()}")
+
+
+class SpeculativeRetrieval:
+    """
+    Hybrid search (and optionally rerank) started on the raw user query
+    while the agent is still deciding whether to call the search tool.
+
+    Args:
+        query: The raw user query
+        limit: Number of hybrid search results
+        rerank: Also rerank the results against the query
+        user_id: User charged for the tokens of the rerank LLM calls
+    """
+
+    def __init__(self, query: str, limit: int, rerank: bool = False, user_id: Optional[str] = None):
+        self.query = query
+        self.limit = limit
+        self.user_id = user_id
+        self.search_task = asyncio.create_task(qdrant_service.hybrid_search_async(query, limit=limit))
+        self.search_task.add_done_callback(_consume_result)
+        self.rerank_task = None
+        # Backend of the speculative rerank, fixed when it starts
+        self.rerank_backend = degradation.rerank_backend() or reranker_service.backend
+        if rerank:
+            self.rerank_task = asyncio.create_task(self._rerank())
+            self.rerank_task.add_done_callback(_consume_result)
+        self.used = False
+
+    async def _rerank(self) -> List[Dict[str, Any]]:
+        search_results = await self.search_task
+        candidates, _ = select_candidates(search_results, self.query)
+        return await reranker_service.rerank(
+            self.query, candidates, settings.RERANK_TOP_K, backend=self.rerank_backend, user_id=self.user_id
+        )
+
+    def matches(self, tool_query: str, limit: int, filters: Optional[Dict[str, str]] = None) -> bool:
+        """Whether a tool call's query is close enough to reuse the speculative search."""
+        # The speculative search is unfiltered, so filtered tool calls always search again
+        if limit != self.limit or filters or self.search_task.cancelled():
+            return False
+        similarity = token_jaccard(self.query, tool_query)
+        logger.info(f"Speculative retrieval similarity {similarity:.2f} for tool query: {tool_query[:50]}")
+        return similarity >= settings.SPECULATIVE_MATCH_THRESHOLD
+
+    async def search_results(self) -> Optional[List[Dict[str, Any]]]:
+        """The speculative search results, or None if the search failed."""
+        try:
+            results = await self.search_task
+        except Exception:
+            return None
+        self.used = True
+        return results
+
+    async def reranked_docs(self, query: str, backend: str) -> Optional[List[Dict[str, Any]]]:
+        """The speculative rerank of the speculative results, if it ran for this query with this backend."""
+        if self.rerank_task is None or query != self.query:
+            return None
+        if backend != self.rerank_backend:
+            logger.info(f"Speculative rerank used {self.rerank_backend}, not {backend}: reranking again")
+            return None
+        try:
+            return await self.rerank_task
+        except Exception:
+            return None
+
+    def cancel(self) -> None:
+        """Cancel any speculative work that is still running."""
+        for task in (self.search_task, self.rerank_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if not self.used:
+            logger.info("Speculative retrieval discarded")
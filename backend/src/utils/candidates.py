@@ -0,0 +1,48 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def select_candidates(results: List[Dict[str, Any]], query: str = "") -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Cut hybrid search results (sorted by RRF score) before reranking.
+
+    The cut goes at the largest relative score drop (the elbow) between
+    ADAPTIVE_DEPTH_MIN and ADAPTIVE_DEPTH_MAX candidates, if that drop is at
+    least ADAPTIVE_DEPTH_GAP_RATIO of the score above it. RRF scores of a
+    single branch fall smoothly as 1 / (rank + k), by less than 1 / (rank + k + 1)
+    per step; a sharp drop means the documents above it were ranked high by
+    both dense and sparse search. Without one the query is ambiguous and
+    ADAPTIVE_DEPTH_MAX candidates are kept.
+
+    Returns:
+        The selected results and a summary {"depth", "total", "reason", "gap"}
+    """
+    total = len(results)
+    max_depth = min(settings.ADAPTIVE_DEPTH_MAX or total, total)
+    min_depth = min(settings.ADAPTIVE_DEPTH_MIN, max_depth)
+
+    depth, reason, best_gap = max_depth, "max", 0.0
+    if not settings.ADAPTIVE_DEPTH_ENABLED:
+        reason = "disabled"
+    elif total <= min_depth:
+        reason = "min"
+    else:
+        scores = [result["score"] for result in results]
+        # Keeping i results cuts between positions i - 1 and i
+        best_depth = max_depth
+        for i in range(max(min_depth, 1), min(max_depth + 1, total)):
+            if scores[i - 1] <= 0:
+                break
+            gap = (scores[i - 1] - scores[i]) / scores[i - 1]
+            if gap > best_gap:
+                best_gap, best_depth = gap, i
+        if best_gap >= settings.ADAPTIVE_DEPTH_GAP_RATIO:
+            depth, reason = best_depth, "gap"
+
+    info = {"depth": depth, "total": total, "reason": reason, "gap": round(best_gap, 3)}
+    logger.info(f"Candidate depth {depth}/{total} ({reason}, largest drop {best_gap:.0%}) for query: {query[:50]}")
+    return results[:depth], info
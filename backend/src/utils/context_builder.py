@@ -0,0 +1,175 @@
+import logging
+import math
+import re
+import threading
+from typing import Any, Dict, List
+
+from src.config import settings
+from src.utils.text import lexical_scores
+
+logger = logging.getLogger(__name__)
+
+# Token estimate when the tiktoken encoding is unavailable (e.g. offline, nothing cached)
+FALLBACK_CHARS_PER_TOKEN = 3
+# Every document keeps at least this many tokens of its clause
+MIN_DOCUMENT_TOKENS = 48
+ELLIPSIS = "[...]"
+
+_encoder = None
+_encoder_lock = threading.Lock()
+_encoder_loaded = False
+# A new point ("a) ", "2. ", "4a. "), possibly quoted, starts after a line break
+_POINT_SPLIT_RE = re.compile(r"\s*\n(?=[“\"]?(?:[a-zđ]\)|\d+[a-z]?\.)\s)")
+# Other line breaks only come from PDF line wrapping
+_WRAP_RE = re.compile(r"\s*\n\s*")
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    with _encoder_lock:
+        if not _encoder_loaded:
+            _encoder_loaded = True
+            try:
+                import tiktoken
+                _encoder = tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens from characters: {e}")
+        return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of `text` for the chat model, or an estimate if its encoding cannot be loaded."""
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+
+
+def _strip_title(content: str, title: str) -> str:
+    # Ingestion stores "title\nclause" as content; the title is already in the group header
+    if title and content.startswith(title):
+        return content[len(title):].lstrip()
+    return content
+
+
+def _points(content: str) -> List[str]:
+    """Split a clause into its lead sentence and points, each unwrapped onto one line."""
+    return [_WRAP_RE.sub(" ", point).strip() for point in _POINT_SPLIT_RE.split(content) if point.strip()]
+
+
+def _truncate(query: str, lines: List[str], max_tokens: int) -> str:
+    """
+    Shorten a clause to about `max_tokens`: keep its lead line (which states
+    the fine and who it applies to) plus the points that best match the
+    query, in their original order, with a marker where points were left out.
+    """
+    text = "\n".join(lines)
+    if not lines or count_tokens(text) <= max_tokens:
+        return text
+
+    costs = [count_tokens(line) for line in lines]
+    keep = {0}
+    used = costs[0]
+    scores = lexical_scores(query, lines)
+    for i in sorted(range(1, len(lines)), key=lambda i: scores[i], reverse=True):
+        if scores[i] <= 0:
+            break
+        if used + costs[i] <= max_tokens:
+            keep.add(i)
+            used += costs[i]
+
+    parts = []
+    previous = -1
+    for i in sorted(keep):
+        if i != previous + 1:
+            parts.append(ELLIPSIS)
+        parts.append(lines[i])
+        previous = i
+    if previous != len(lines) - 1:
+        parts.append(ELLIPSIS)
+
+    text = "\n".join(parts)
+    if count_tokens(text) > max_tokens:
+        # A single huge line: cut by characters
+        text = text[:max_tokens * FALLBACK_CHARS_PER_TOKEN] + " " + ELLIPSIS
+    return text
+
+
+def _full_text(documents: List[Dict[str, Any]]) -> str:
+    # The previous one-block-per-document layout, as the baseline for "tokens saved"
+    blocks = []
+    for doc in documents:
+        payload = doc.get("payload", {})
+        blocks.append(
+            f"Year: {payload.get('year', '')}\nArticle: {payload.get('article', '')}\n"
+            f"Title: {payload.get('title', '')}\nContent: {payload.get('content', '')}\n\n"
+        )
+    return "".join(blocks)
+
+
+def build_context(
+    query: str,
+    documents: List[Dict[str, Any]],
+    max_tokens: int,
+    label: str = "Document",
+    start_index: int = 0,
+) -> Dict[str, Any]:
+    """
+    Encode documents compactly for an LLM prompt, within a token budget.
+
+    Clauses of the same decree year and article are grouped under one
+    "Year | Article | Title" header, in the order their best document
+    appears. The title is removed from each clause's text and PDF line
+    wraps are joined, leaving one line per point. Every
+    document keeps its "[label N]" marker, numbered from `start_index` in
+    input order. The budget is shared out in input order: a document gets
+    an equal share of what is left, and short clauses leave the rest to
+    the documents after them. Longer clauses are cut down around the lines
+    that match the query.
+
+    Args:
+        query: The user query, to choose which lines of long clauses to keep
+        documents: Search results with payloads, most relevant first
+        max_tokens: Token budget for the whole context
+        label: Document marker text, e.g. "Document ID" for the reranker
+        start_index: Number of the first document
+
+    Returns:
+        {"text", "tokens", "full_tokens", "saved_tokens"}
+    """
+    groups: Dict[tuple, List[str]] = {}
+    remaining = max_tokens
+    for position, doc in enumerate(documents):
+        payload = doc.get("payload", {})
+        year = payload.get("year", "")
+        article = payload.get("article", "")
+        title = payload.get("title", "")
+        key = (year, article, title)
+        if key not in groups:
+            groups[key] = []
+            remaining -= count_tokens(f"### Year: {year} | Article: {article} | Title: {title}\n")
+
+        marker = f"[{label} {start_index + position}]"
+        share = max(remaining // (len(documents) - position), MIN_DOCUMENT_TOKENS)
+        content = _truncate(query, _points(_strip_title(payload.get("content", ""), title)), share)
+        block = f"{marker}\n{content}"
+        remaining -= count_tokens(block)
+        groups[key].append(block)
+
+    text = "\n\n".join(
+        f"### Year: {year} | Article: {article} | Title: {title}\n" + "\n".join(blocks)
+        for (year, article, title), blocks in groups.items()
+    )
+
+    tokens = count_tokens(text)
+    full_tokens = count_tokens(_full_text(documents))
+    logger.info(
+        f"Context for {len(documents)} documents: {tokens} tokens "
+        f"({full_tokens - tokens} saved of {full_tokens}, budget {max_tokens})"
+    )
+    return {
+        "text": text,
+        "tokens": tokens,
+        "full_tokens": full_tokens,
+        "saved_tokens": full_tokens - tokens,
+    }
@@ -0,0 +1,244 @@
+import asyncio
+import heapq
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional
+
+# Wait and hold times kept for the percentiles in stats() and recent()
+WAIT_SAMPLES = 1024
+# Weight of the latest hold time in the moving average used for Retry-After
+HOLD_TIME_ALPHA = 0.1
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+class Overloaded(Exception):
+    """
+    A stage refused work: its wait queue was full (429) or the wait timed out (503).
+
+    Attributes:
+        stage: Name of the stage that refused
+        status_code: HTTP status to answer with
+        retry_after: Suggested seconds before retrying
+    """
+
+    def __init__(self, stage: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"{stage} overloaded: {reason}")
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """
+    Concurrency limit with a bounded wait queue and a queue-time deadline.
+
+    Up to `max_concurrency` callers hold a slot at once and up to
+    `max_queue` more wait for one. A caller that finds the queue full is
+    refused at once (429); one that waits longer than `queue_timeout` is
+    refused when the deadline passes (503). Both carry a Retry-After
+    estimate from the average time a slot is held.
+
+    Args:
+        name: Stage name, for errors and metrics
+        max_concurrency: Slots held at the same time
+        max_queue: Callers allowed to wait for a slot
+        queue_timeout: Seconds a caller may wait, None to wait indefinitely
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: Optional[float] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        # (monotonic time, seconds)
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._holds = deque(maxlen=WAIT_SAMPLES)
+        self._hold_seconds = 0.0
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Wait for a slot; pair with `release()`.
+
+        Args:
+            timeout: Overrides `queue_timeout` for this call (e.g. the time left before a request deadline)
+
+        Returns:
+            The monotonic time the slot was granted, to pass to `release()`
+        """
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise Overloaded(self.name, 429, self.retry_after(), "wait queue full")
+
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            # A free slot is taken at once; wait_for would only grant it on a later loop iteration
+            if timeout is None or not self._semaphore.locked():
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise Overloaded(self.name, 503, self.retry_after(), f"no slot within {timeout:.1f}s") from None
+        finally:
+            self.waiting -= 1
+
+        granted = time.monotonic()
+        self._waits.append((granted, granted - start))
+        self.active += 1
+        self.admitted += 1
+        return granted
+
+    def release(self, granted: Optional[float] = None) -> None:
+        self._record_hold(granted)
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        granted = await self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new caller has likely drained, at least 1."""
+        rounds = (self.waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * self._hold_seconds))
+
+    def recent(self, since: float) -> Dict[str, float]:
+        """Current queue fill (0-1) and p95 wait / hold times in seconds of the calls since a monotonic time."""
+        waits = sorted(seconds for at, seconds in list(self._waits) if at >= since)
+        holds = sorted(seconds for at, seconds in list(self._holds) if at >= since)
+        return {
+            "queue_fill": self.waiting / self.max_queue if self.max_queue else float(self.waiting > 0),
+            "wait_p95": _percentile(waits, 0.95),
+            "hold_p95": _percentile(holds, 0.95),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(seconds for _, seconds in list(self._waits))
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_avg": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+            "wait_ms_p95": round(1000 * _percentile(waits, 0.95), 2),
+            "hold_ms_avg": round(1000 * self._hold_seconds, 2),
+        }
+
+    def _record_hold(self, granted: Optional[float]) -> None:
+        if granted is None:
+            return
+        now = time.monotonic()
+        held = now - granted
+        self._holds.append((now, held))
+        self._hold_seconds += HOLD_TIME_ALPHA * (held - self._hold_seconds)
+
+
+class FairStageLimiter(StageLimiter):
+    """
+    StageLimiter that hands free slots to waiters by weighted fair queuing
+    instead of arrival order.
+
+    Each caller passes a key (the user) and a weight. Waiters are tagged as
+    in start-time fair queuing: a request starts at the later of the current
+    virtual time and the finish tag of its key's previous request, and
+    finishes 1 / weight after that. Free slots go to the smallest finish
+    tag, so a key with many queued requests only delays its own, and a key
+    of weight 2 gets twice the slots of a key of weight 1 under contention.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: Optional[float] = None):
+        super().__init__(name, max_concurrency, max_queue, queue_timeout)
+        # [finish tag, sequence, start tag, future]
+        self._heap: List[list] = []
+        self._finish_tags: Dict[Hashable, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = 0
+
+    async def acquire(self, timeout: Optional[float] = None, key: Hashable = None, weight: float = 1.0) -> float:
+        """Like StageLimiter.acquire, queued fairly by `key` with `weight`."""
+        start = time.monotonic()
+        if self.active < self.max_concurrency and not self.waiting:
+            return self._grant(start)
+        if self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise Overloaded(self.name, 429, self.retry_after(), "wait queue full")
+
+        start_tag = max(self._virtual_time, self._finish_tags.get(key, 0.0))
+        finish_tag = start_tag + 1.0 / max(weight, 1e-6)
+        self._finish_tags[key] = finish_tag
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._heap, [finish_tag, self._sequence, start_tag, future])
+
+        timeout = self.queue_timeout if timeout is None else timeout
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended: pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                raise Overloaded(self.name, 503, self.retry_after(), f"no slot within {timeout:.1f}s") from None
+            raise
+        finally:
+            self.waiting -= 1
+
+        # The releasing caller's slot was transferred, `active` already counts it
+        granted = time.monotonic()
+        self._waits.append((granted, granted - start))
+        self.admitted += 1
+        return granted
+
+    def release(self, granted: Optional[float] = None) -> None:
+        self._record_hold(granted)
+        while self._heap:
+            _, _, start_tag, future = heapq.heappop(self._heap)
+            if future.done():
+                # Timed out or cancelled while waiting
+                continue
+            self._virtual_time = start_tag
+            future.set_result(None)
+            return
+        self.active -= 1
+        # Nobody is waiting: earlier finish tags no longer matter
+        self._finish_tags.clear()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None, key: Hashable = None, weight: float = 1.0) -> AsyncIterator[None]:
+        granted = await self.acquire(timeout, key, weight)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def _grant(self, start: float) -> float:
+        self.active += 1
+        self.admitted += 1
+        granted = time.monotonic()
+        self._waits.append((granted, granted - start))
+        return granted
@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
@@ -13,5 +14,13 @@ class PromptManager:
     def render(self, template_name: str, **kwargs) -> str:
         template = self.env.get_template(template_name)
         return template.render(**kwargs)
+    
+    def template_hash(self, *template_names: str) -> str:
+        """Short hash of the templates' sources, to scope caches of model outputs to a prompt version."""
+        digest = hashlib.sha256()
+        for template_name in template_names:
+            source, _, _ = self.env.loader.get_source(self.env, template_name)
+            digest.update(source.encode("utf-8"))
+        return digest.hexdigest()[:16]
 
 prompt_manager = PromptManager()
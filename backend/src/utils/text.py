@@ -0,0 +1,80 @@
+import math
+import re
+import unicodedata
+from typing import List
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+# Vehicle names in questions, by class: fines differ by vehicle type
+_VEHICLE_CLASSES = {
+    "xe máy": "motorbike",
+    "xe gắn máy": "motorbike",
+    "mô tô": "motorbike",
+    "ô tô": "car",
+    "xe hơi": "car",
+    "xe đạp": "bicycle",
+    "xe tải": "truck",
+    "xe khách": "coach",
+    "máy kéo": "tractor",
+    "xe chuyên dùng": "special",
+}
+_VEHICLE_RES = {
+    phrase: re.compile(rf"(?<!\w){re.escape(phrase)}(?!\w)") for phrase in _VEHICLE_CLASSES
+}
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a user query for cache keys: Unicode NFC, collapsed whitespace, casefolded."""
+    query = unicodedata.normalize("NFC", query)
+    query = _WHITESPACE_RE.sub(" ", query).strip()
+    return query.casefold()
+
+
+def token_jaccard(a: str, b: str) -> float:
+    """Jaccard similarity of the normalized word sets of two strings."""
+    tokens_a = set(_WORD_RE.findall(normalize_query(a)))
+    tokens_b = set(_WORD_RE.findall(normalize_query(b)))
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def key_terms(text: str) -> frozenset:
+    """
+    Numbers and vehicle classes named in a text. Questions that differ in
+    these (e.g. "xe máy" vs "ô tô", 2019 vs 2024) ask for different answers,
+    however similar their embeddings are.
+    """
+    text = normalize_query(text)
+    terms = {f"#{number}" for number in _NUMBER_RE.findall(text)}
+    terms.update(vehicle for phrase, vehicle in _VEHICLE_CLASSES.items() if _VEHICLE_RES[phrase].search(text))
+    return frozenset(terms)
+
+
+def _terms(text: str) -> set:
+    # Vietnamese words often span several syllables, so adjacent pairs count as terms too
+    tokens = _WORD_RE.findall(normalize_query(text))
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def lexical_scores(query: str, texts: List[str]) -> List[float]:
+    """
+    Share of the query's unigrams and bigrams found in each text, in [0, 1].
+
+    Terms are weighted by their IDF within `texts`, so words shared by all
+    candidates (e.g. "phạt", "xe") count less than distinctive ones.
+    """
+    query_terms = _terms(query)
+    text_terms = [_terms(text) for text in texts]
+    if not query_terms or not texts:
+        return [0.0] * len(texts)
+
+    n = len(texts)
+    weights = {}
+    for term in query_terms:
+        df = sum(1 for terms in text_terms if term in terms)
+        weights[term] = math.log(1 + n / max(df, 1))
+    total = sum(weights.values())
+
+    return [sum(weight for term, weight in weights.items() if term in terms) / total for terms in text_terms]
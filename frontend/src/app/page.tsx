@@ -22,6 +22,16 @@ type Message = {
   tools?: ToolExecution[]
 }
 
+// Per-browser id, so the backend's per-user limits apply to each visitor separately
+function getUserId(): string {
+  let userId = localStorage.getItem("user_id")
+  if (!userId) {
+    userId = crypto.randomUUID()
+    localStorage.setItem("user_id", userId)
+  }
+  return userId
+}
+
 export default function Home() {
   const [messages, setMessages] = useState<Message[]>([
     { id: 1, text: "Xin chào! Tôi là trợ lý ảo của hệ thống luật giao thông. Tôi có thể giúp gì cho bạn?", sender: "assistant" }
@@ -74,7 +84,7 @@ export default function Home() {
       const requestBody = {
         query: userMessage,
         chat_history: chatHistory,
-        user_id: "abcd-efgh-ijkl-mnop"
+        user_id: getUserId()
       }
 
       const apiUrl = `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/v0/agent/chat`;
@@ -191,6 +201,15 @@ export default function Home() {
                 tempToolContent = ""
               }
             }
+            else if (chunk.type === "answer_delta") {
+              finalAnswer += chunk.content
+              setTypingMessage(finalAnswer)
+            }
+            else if (chunk.type === "answer_reset") {
+              // The streamed text preceded a tool call, the answer comes later
+              finalAnswer = ""
+              setTypingMessage("")
+            }
             else if (chunk.type === "answer") {
               finalAnswer = chunk.content
               setTypingMessage(finalAnswer)
@@ -3,6 +3,8 @@ import os
 os.environ["OMP_NUM_THREADS"] = "1" 
 os.environ["ONNXRUNTIME_INTRA_OP_NUM_THREADS"] = "1"
 
+import argparse
+import hashlib
 import json
 import logging
 import uuid
@@ -10,6 +12,8 @@ import os
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 
+import numpy as np
+from fastembed import TextEmbedding, SparseTextEmbedding
 from qdrant_client import QdrantClient, models
 # Removed SentenceSplitter since chunking is no longer used
 
@@ -36,32 +40,267 @@ DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "traffic_laws.json")
 # Jina AI v3 embedding model configuration
 DENSE_MODEL_NAME = "jinaai/jina-embeddings-v3"
 DENSE_VECTOR_SIZE = 1024  # Jina v3 default is 1024
+# Jina v3 is trained with Matryoshka loss, so its vectors can be truncated to a prefix
+MATRYOSHKA_DIMS = [DENSE_VECTOR_SIZE, 512, 256]
+QUANTIZATIONS = ["none", "scalar", "binary"]
+# Payload fields the backend filters on (decree year, article number)
+KEYWORD_INDEX_FIELDS = ["year", "article"]
 SPARSE_MODEL_NAME = "Qdrant/bm25"
 
-def main():
-    # 1. Connect to Qdrant
-    logger.info(f"Connecting to Qdrant at {QDRANT_URL}...")
-    client = QdrantClient(
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY
+EMBED_BATCH_SIZE = 16
+UPSERT_BATCH_SIZE = 64
+# Namespace for deterministic point ids, so re-ingestion overwrites points instead of duplicating them
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, COLLECTION_NAME)
+# Vectorless point whose payload holds the corpus version (read by the backend's answer cache)
+CORPUS_VERSION_POINT_ID = uuid.uuid5(POINT_ID_NAMESPACE, "corpus_version").hex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest traffic law clauses into Qdrant.")
+    parser.add_argument(
+        "--embedded-index-dir",
+        help="Also export a dense matrix + sparse index for SEARCH_BACKEND=embedded to this directory"
+    )
+    parser.add_argument(
+        "--docstore-dir",
+        help="Also write the payloads to a memory-mapped document store for DOCUMENT_STORE_DIR"
+    )
+    parser.add_argument(
+        "--dense-dim",
+        type=int,
+        choices=MATRYOSHKA_DIMS,
+        default=int(os.getenv("DENSE_VECTOR_DIM") or DENSE_VECTOR_SIZE),
+        help="Truncate dense vectors to this Matryoshka dimension (backend: DENSE_VECTOR_DIM)"
     )
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default=os.getenv("DENSE_QUANTIZATION", "none"),
+        help="Quantize the dense vectors in Qdrant (backend: DENSE_QUANTIZATION)"
+    )
+    parser.add_argument(
+        "--skip-qdrant",
+        action="store_true",
+        help="Do not upsert into Qdrant (only useful with --embedded-index-dir or --docstore-dir)"
+    )
+    return parser.parse_args()
+
+
+def build_records(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn articles into one record (id, text, payload) per clause."""
+    records = []
+    for article in data:
+        year = article.get("year", "")
+        article_id = article.get("article", "")
+        title = article.get("title", "")
+        clauses = article.get("clauses", [])
+
+        for clause in clauses:
+            clause_content = clause.get("content", "")
+            
+            # Combine title and content into a single text block
+            full_text = f"{title}\n{clause_content}"
+            
+            # Create payload
+            payload = {
+                "year": year,
+                "article": article_id,
+                "title": title,
+                "content": full_text  # Store the full text
+            }
+            
+            records.append({
+                "id": uuid.uuid5(POINT_ID_NAMESPACE, f"{year}/{article_id}/{full_text}").hex,
+                "text": full_text,
+                "payload": payload
+            })
+    return records
+
+
+def corpus_version(records: List[Dict[str, Any]], dense_dim: int) -> str:
+    """Hash of the ingested clauses and the dense embedding, identifying what searches can return."""
+    digest = hashlib.sha256(f"{DENSE_MODEL_NAME}@{dense_dim}|{SPARSE_MODEL_NAME}".encode("utf-8"))
+    for record in records:
+        digest.update(json.dumps([record["id"], record["payload"]], ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def truncate_dense(dense_vectors: np.ndarray, dim: int) -> np.ndarray:
+    """Keep the first `dim` Matryoshka dimensions and renormalize."""
+    if dim >= dense_vectors.shape[1]:
+        return dense_vectors
+    truncated = dense_vectors[:, :dim]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (truncated / norms).astype(np.float32)
+
+
+def quantization_config(quantization: str):
+    """Qdrant quantization config for the dense vector; the compressed vectors stay in RAM."""
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def embed_records(records: List[Dict[str, Any]]):
+    """Compute passage embeddings for all records (no chunking, full text per clause)."""
+    texts = [record["text"] for record in records]
+    
+    logger.info(f"Computing dense embeddings with {DENSE_MODEL_NAME}...")
+    dense_model = TextEmbedding(DENSE_MODEL_NAME)
+    dense_vectors = np.array(list(dense_model.embed(texts, batch_size=EMBED_BATCH_SIZE)), dtype=np.float32)
+    
+    logger.info(f"Computing sparse embeddings with {SPARSE_MODEL_NAME}...")
+    sparse_model = SparseTextEmbedding(SPARSE_MODEL_NAME)
+    sparse_vectors = list(sparse_model.embed(texts, batch_size=EMBED_BATCH_SIZE))
+    
+    return dense_vectors, sparse_vectors
+
+
+def export_embedded_index(index_dir: str, records: List[Dict[str, Any]], dense_vectors, sparse_vectors, version: str):
+    """
+    Write the files loaded by the backend's embedded search engine:
+    dense.npy (L2-normalized float32 matrix), the sparse vectors as CSR
+    arrays, and points.json with the id and payload of each row.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    
+    norms = np.linalg.norm(dense_vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    np.save(os.path.join(index_dir, "dense.npy"), (dense_vectors / norms).astype(np.float32))
+    
+    indptr = np.zeros(len(sparse_vectors) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(vector.indices) for vector in sparse_vectors])
+    np.save(os.path.join(index_dir, "sparse_indptr.npy"), indptr)
+    np.save(os.path.join(index_dir, "sparse_indices.npy"), np.concatenate([vector.indices for vector in sparse_vectors]).astype(np.int64))
+    np.save(os.path.join(index_dir, "sparse_values.npy"), np.concatenate([vector.values for vector in sparse_vectors]).astype(np.float32))
+    
+    with open(os.path.join(index_dir, "points.json"), "w", encoding="utf-8") as f:
+        json.dump([{"id": record["id"], "payload": record["payload"]} for record in records], f, ensure_ascii=False)
+    
+    with open(os.path.join(index_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "collection": COLLECTION_NAME,
+            "dense_model": DENSE_MODEL_NAME,
+            "sparse_model": SPARSE_MODEL_NAME,
+            "count": len(records),
+            "dense_dim": int(dense_vectors.shape[1]),
+            "corpus_version": version
+        }, f, indent=2)
+    
+    logger.info(f"Embedded index with {len(records)} points written to {index_dir}")
+
+
+def export_document_store(store_dir: str, records: List[Dict[str, Any]]):
+    """
+    Write the backend's document store: payloads.bin with the UTF-8 JSON
+    payloads back to back, offsets.npy with the start offset of each payload
+    (plus the end of the last one) and ids.json with the point id of each row.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    
+    offsets = [0]
+    with open(os.path.join(store_dir, "payloads.bin"), "wb") as f:
+        for record in records:
+            offsets.append(offsets[-1] + f.write(json.dumps(record["payload"], ensure_ascii=False).encode("utf-8")))
+    np.save(os.path.join(store_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    
+    with open(os.path.join(store_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump([record["id"] for record in records], f)
+    
+    logger.info(f"Document store with {len(records)} payloads written to {store_dir}")
+
+
+def upsert_to_qdrant(client: QdrantClient, records: List[Dict[str, Any]], dense_vectors, sparse_vectors) -> bool:
+    """Upsert the records in batches; returns False if any batch failed."""
+    points = [
+        models.PointStruct(
+            id=record["id"],
+            vector={
+                "dense": dense_vector.tolist(),
+                "sparse": models.SparseVector(
+                    indices=sparse_vector.indices.tolist(),
+                    values=sparse_vector.values.tolist()
+                ),
+            },
+            payload=record["payload"]
+        )
+        for record, dense_vector, sparse_vector in zip(records, dense_vectors, sparse_vectors)
+    ]
+
+    logger.info(f"Upserting {len(points)} points to Qdrant...")
+    
+    # Batch upsert
+    total_batches = (len(points) + UPSERT_BATCH_SIZE - 1) // UPSERT_BATCH_SIZE
+    failed = 0
     
-    # 2. Create Collection
+    for i in range(0, len(points), UPSERT_BATCH_SIZE):
+        batch = points[i:i + UPSERT_BATCH_SIZE]
+        try:
+            client.upsert(
+                collection_name=COLLECTION_NAME,
+                points=batch
+            )
+            logger.info(f"Upserted batch {i // UPSERT_BATCH_SIZE + 1}/{total_batches}")
+        except Exception as e:
+            logger.error(f"Error upserting batch {i // UPSERT_BATCH_SIZE + 1}: {e}")
+            failed += 1
+    return failed == 0
+
+
+def write_corpus_version(client: QdrantClient, version: str):
+    """Record the corpus version in the collection, so the backend drops answers cached for the old corpus."""
+    client.upsert(
+        collection_name=COLLECTION_NAME,
+        points=[models.PointStruct(id=CORPUS_VERSION_POINT_ID, vector={}, payload={"corpus_version": version})],
+        wait=True,
+    )
+    logger.info(f"Corpus version {version} written to {COLLECTION_NAME}.")
+
+
+def has_legacy_point_ids(client: QdrantClient, sample_size: int = 64) -> bool:
+    """Whether the collection holds random (uuid4) point ids from before ids were derived from the clause."""
+    points, _ = client.scroll(COLLECTION_NAME, limit=sample_size, with_payload=True, with_vectors=False)
+    for point in points:
+        payload = point.payload or {}
+        if "content" not in payload:
+            # The corpus version point
+            continue
+        expected = uuid.uuid5(POINT_ID_NAMESPACE, f"{payload.get('year', '')}/{payload.get('article', '')}/{payload['content']}")
+        if uuid.UUID(str(point.id)) != expected:
+            return True
+    return False
+
+
+def create_collection(client: QdrantClient, dense_dim: int = DENSE_VECTOR_SIZE, quantization: str = "none"):
     collection_exists = False
     try:
-        client.get_collection(COLLECTION_NAME)
+        info = client.get_collection(COLLECTION_NAME)
         collection_exists = True
     except Exception:
         pass
 
+    # Upserting deterministic ids into such a collection would add a second copy of every clause
+    if collection_exists and has_legacy_point_ids(client):
+        logger.warning(f"Collection {COLLECTION_NAME} has point ids of the old random scheme, recreating it.")
+        client.delete_collection(COLLECTION_NAME)
+        collection_exists = False
+
     if not collection_exists:
-        logger.info(f"Creating collection {COLLECTION_NAME}...")
+        logger.info(f"Creating collection {COLLECTION_NAME} (dense dim {dense_dim}, quantization {quantization})...")
         client.create_collection(
             collection_name=COLLECTION_NAME,
             vectors_config={
                 "dense": models.VectorParams(
                     distance=models.Distance.COSINE,
-                    size=DENSE_VECTOR_SIZE,
+                    size=dense_dim,
+                    # With quantization the original vectors are only read for rescoring
+                    on_disk=quantization != "none",
+                    quantization_config=quantization_config(quantization),
                 ),
             },
             sparse_vectors_config={
@@ -72,9 +311,41 @@ def main():
         )
         logger.info("Collection created.")
     else:
-        logger.info(f"Collection {COLLECTION_NAME} already exists.")
+        existing_dim = info.config.params.vectors["dense"].size
+        if existing_dim != dense_dim:
+            raise ValueError(
+                f"Collection {COLLECTION_NAME} has {existing_dim}-d dense vectors, not {dense_dim}. "
+                "Delete it to rebuild with another dimension."
+            )
+        logger.info(f"Collection {COLLECTION_NAME} already exists, setting quantization to {quantization}.")
+        # Quantization can be changed in place; Qdrant rebuilds the compressed vectors in the background
+        client.update_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config={
+                "dense": models.VectorParamsDiff(
+                    on_disk=quantization != "none",
+                    quantization_config=quantization_config(quantization) or models.Disabled.DISABLED,
+                )
+            },
+        )
 
-    # 3. Load Data
+
+def create_payload_indexes(client: QdrantClient):
+    """Keyword indexes for the filterable payload fields; creating an existing index is a no-op."""
+    for field in KEYWORD_INDEX_FIELDS:
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name=field,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+            wait=True,
+        )
+    logger.info(f"Payload indexes on {KEYWORD_INDEX_FIELDS} ready.")
+
+
+def main():
+    args = parse_args()
+
+    # 1. Load Data
     logger.info(f"Loading data from {DATA_FILE}...")
     try:
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
@@ -83,63 +354,40 @@ def main():
         logger.error(f"File {DATA_FILE} not found.")
         return
 
-    points = []
-    
     logger.info("Processing data (full text per clause)...")
-    for article in data:
-        year = article.get("year", "")
-        article_id = article.get("article", "")
-        title = article.get("title", "")
-        clauses = article.get("clauses", [])
+    records = build_records(data)
 
-        for clause in clauses:
-            clause_content = clause.get("content", "")
-            
-            # Combine title and content into a single text block
-            full_text = f"{title}\n{clause_content}"
-            
-            # Create payload
-            payload = {
-                "year": year,
-                "article": article_id,
-                "title": title,
-                "content": full_text  # Store the full text
-            }
-            
-            # Create Point (no chunking, use full_text directly)
-            point = models.PointStruct(
-                id=uuid.uuid4().hex,
-                vector={
-                    "dense": models.Document(
-                        text=full_text,
-                        model=DENSE_MODEL_NAME,
-                    ),
-                    "sparse": models.Document(
-                        text=full_text,
-                        model=SPARSE_MODEL_NAME,
-                    ),
-                },
-                payload=payload
-            )
-            points.append(point)
+    # 2. Embed
+    dense_vectors, sparse_vectors = embed_records(records)
+    dense_vectors = truncate_dense(dense_vectors, args.dense_dim)
+    version = corpus_version(records, args.dense_dim)
 
-    # 5. Upsert to Qdrant
-    logger.info(f"Upserting {len(points)} points to Qdrant...")
-    
-    # Batch upsert
-    BATCH_SIZE = 3
-    total_batches = (len(points) + BATCH_SIZE - 1) // BATCH_SIZE
+    # 3. Export the embedded search index and the document store
+    if args.embedded_index_dir:
+        export_embedded_index(args.embedded_index_dir, records, dense_vectors, sparse_vectors, version)
+    if args.docstore_dir:
+        export_document_store(args.docstore_dir, records)
+
+    if args.skip_qdrant:
+        logger.info("Skipping Qdrant upsert.")
+        return
+
+    # 4. Connect to Qdrant
+    logger.info(f"Connecting to Qdrant at {QDRANT_URL}...")
+    client = QdrantClient(
+        url=QDRANT_URL,
+        api_key=QDRANT_API_KEY
+    )
     
-    for i in range(0, len(points), BATCH_SIZE):
-        batch = points[i:i + BATCH_SIZE]
-        try:
-            client.upsert(
-                collection_name=COLLECTION_NAME,
-                points=batch
-            )
-            logger.info(f"Upserted batch {i // BATCH_SIZE + 1}/{total_batches}")
-        except Exception as e:
-            logger.error(f"Error upserting batch {i // BATCH_SIZE + 1}: {e}")
+    # 5. Create Collection and payload indexes
+    create_collection(client, args.dense_dim, args.quantization)
+    create_payload_indexes(client)
+
+    # 6. Upsert to Qdrant
+    if upsert_to_qdrant(client, records, dense_vectors, sparse_vectors):
+        write_corpus_version(client, version)
+    else:
+        logger.warning("Some batches failed, corpus version not updated; re-run the ingestion.")
 
     logger.info("Data ingestion complete.")
 